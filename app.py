@@ -1,33 +1,113 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, send_file
 import chess
+import functools
+import json
+import os
 import time
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from scheduler import SCHEDULER, INTERACTIVE, ANALYSIS, CANCELLED
+import metrics
+import profiling
+from versions import mate_solver
 
 # --- IMPORT YOUR ENGINE ---
 # Ensure your engine logic is in 'versions/my_engine_v3.py' or 'engine.py'
 try:
-    from versions.my_engine_v3 import get_best_move_iterative, evaluate_board
+    from versions.my_engine_v3 import get_best_move_iterative, static_eval, LAST_SEARCH
 except ImportError:
     # Fallback if file structure differs
-    from versions.my_engine_v3 import get_best_move_iterative, evaluate_board
+    from versions.my_engine_v3 import get_best_move_iterative, static_eval, LAST_SEARCH
 
 app = Flask(__name__)
 CORS(app)
+# Behind N reverse proxies: trust the last N X-Forwarded-For hops for request.remote_addr
+if int(os.environ.get('HALFMIND_PROXIES', '0')):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ['HALFMIND_PROXIES']))
 
 # Global board state (optional usage, mostly relying on FEN from frontend)
 board = chess.Board()
 
+HEARTBEAT = 0.5  # seconds between keep-alive bytes while a search runs
+# Cap on the mate solver's node table per request. A node is ~190 bytes and ~70 us, and /mate
+# holds the worker's only search thread: 200k nodes is ~40 MB and ~15 s
+MATE_MAX_NODES = mate_solver.MAX_NODES
+
+# Difficulty presets: a node budget instead of depth / wall-clock time, so a level plays the
+# same on a busy server and costs little CPU at the bottom end. margin > 0 makes the engine
+# pick at random among root moves within that many centipawns of the best one.
+LEVELS = {
+    1: {'nodes': 100, 'margin': 200},
+    2: {'nodes': 400, 'margin': 100},
+    3: {'nodes': 1500, 'margin': 50},
+    4: {'nodes': 5000, 'margin': 20},
+    5: {'nodes': 10000, 'margin': 0},
+    6: {'nodes': 25000, 'margin': 0},
+}
+LEVEL_DEPTH = 64          # node-limited searches stop on nodes, not depth
+LEVEL_TIME_LIMIT = 60.0   # safety net only; a level's budget normally ends the search first
+
+def search_limits(data):
+    # depth, time_limit and engine kwargs (nodes / margin) for a request
+    level = LEVELS.get(int(data['level'])) if data.get('level') else None
+    if level:
+        return LEVEL_DEPTH, LEVEL_TIME_LIMIT, dict(level)
+    limits = {}
+    if data.get('nodes'):
+        limits['nodes'] = max(1, int(data['nodes']))
+        limits['margin'] = max(0, int(data.get('margin', 0)))
+    depth = int(data.get('depth', LEVEL_DEPTH if limits else 3))
+    return depth, float(data.get('time_limit', LEVEL_TIME_LIMIT if limits else 1.0)), limits
+
+def client_id():
+    # Fairness and job ownership key. Only the peer address: anything in the body or in
+    # X-Forwarded-For is up to the client (behind a proxy, set HALFMIND_PROXIES instead)
+    return request.remote_addr
+
+def engine_call(data, profile_info, time_limit):
+    # Engine entry point for this request, wrapped in a profiler when asked for (or sampled)
+    fn = get_best_move_iterative
+    if profiling.should_profile(data.get('profile')):
+        if data.get('profile') and profiling.PROFILE_REQUESTS:
+            # Asked for a profile: search for real instead of answering from the analysis cache
+            fn = functools.partial(fn, use_cache=False)
+        # Book / cache / resume answers didn't search: no profile for those
+        fn = profiling.profiled(fn, profile_info, data.get('profile_mode', 'cprofile'),
+                                skip_if=lambda: LAST_SEARCH.get('source') != 'search')
+    return metrics.observed(fn, time_limit)
+
+def finish(endpoint, start, response):
+    # Every /move and /analyze reply goes through here so it is counted
+    metrics.record_request(endpoint, response.get('status', 'unknown'), time.time() - start)
+    return response
+
+def stream_job(job, on_done):
+    # Leading whitespace is valid JSON. Writing it regularly is how we notice a closed tab:
+    # the write fails, the server closes this generator and the search is cancelled.
+    def generate():
+        try:
+            while not job.wait(HEARTBEAT):
+                yield ' '
+            yield json.dumps(on_done(job))
+        finally:
+            if not job.done.is_set():
+                print(f"[Scheduler] client gone, cancelling job {job.id}")
+                SCHEDULER.cancel(job.id)
+    return Response(generate(), mimetype='application/json', headers={'X-Job-Id': job.id})
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/move', methods=['POST'])
 def move():
+    start = time.time()
     data = request.json
     fen = data.get('fen')
     move_uci = data.get('move') # This might be None if engine moves first!
-    depth = int(data.get('depth', 3))
-    time_limit = float(data.get('time_limit', 1.0))
+    # {"level": 1-6} or {"nodes": N, "margin": cp} or the old depth / time_limit
+    depth, time_limit, limits = search_limits(data)
 
     # 1. Initialize board from client state
     board = chess.Board(fen)
@@ -39,50 +119,204 @@ def move():
             if move in board.legal_moves:
                 board.push(move)
             else:
-                return jsonify({'status': 'illegal', 'fen': board.fen(), 'message': 'Illegal move'})
+                return jsonify(finish('move', start, {'status': 'illegal', 'fen': board.fen(), 'message': 'Illegal move'}))
         except:
-            return jsonify({'status': 'error', 'fen': board.fen(), 'message': 'Invalid move format'})
+            return jsonify(finish('move', start, {'status': 'error', 'fen': board.fen(), 'message': 'Invalid move format'}))
 
     # 3. Check Game Over (After human move)
     if board.is_game_over():
-        return jsonify({
+        return jsonify(finish('move', start, {
             'status': 'game_over', 
             'result': get_game_result(board), 
             'fen': board.fen()
-        })
+        }))
 
-    # 4. Engine Thinking
-    start = time.time()
-    try:
-        best_move = get_best_move_iterative(board, depth, time_limit)
+    # 4. Engine Thinking (queued on the search scheduler)
+    profile_info = {}
+    job = SCHEDULER.submit(
+        engine_call(data, profile_info, time_limit), board.copy(), depth, time_limit, **limits,
+        client_id=client_id(), game_id=data.get('game_id'), priority=INTERACTIVE,
+    )
+    metrics.touch()
+
+    def reply(job):
+        response = reply_move(job)
+        if profile_info:
+            response['profile_id'] = profile_info['id']
+        return finish('move', start, response)
+
+    def reply_move(job):
         think_time = time.time() - start
+        if job.state == CANCELLED:
+            return {'status': 'cancelled', 'fen': board.fen()}
+        if job.error:
+            print(f"Engine Error: {job.error}")
+            return {'status': 'error', 'message': str(job.error)}
 
+        best_move = job.result
         if best_move:
             board.push(best_move)
-            eval_score = evaluate_board(board)
-            
+            # The eval is static only: score finished games here. static_eval, not evaluate_board:
+            # this is the request thread and the eval cache belongs to the search (scheduler thread)
+            if board.is_checkmate():
+                eval_score = -9999 if board.turn else 9999
+            elif board.is_game_over():
+                eval_score = 0
+            else:
+                eval_score = static_eval(board)[0]
+
             # Check game over (After AI move)
             status = 'game_over' if board.is_game_over() else 'success'
             result = get_game_result(board) if board.is_game_over() else None
 
-            return jsonify({
+            return {
                 'status': status,
                 'result': result,
                 'fen': board.fen(),
                 'best_move': best_move.uci(),
                 'eval': eval_score,
                 'time': f"{think_time:.2f}s"
-            })
+            }
+        else:
+            return {'status': 'no_move', 'fen': board.fen()}
+
+    return stream_job(job, reply)
+
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    start = time.time()
+    data = request.json
+    fen = data.get('fen')
+    depth = int(data.get('depth', 3))
+    time_limit = float(data.get('time_limit', 1.0))
+    multipv = max(1, min(int(data.get('multipv', 3)), 10))
+
+    try:
+        board = chess.Board(fen) if fen else chess.Board()
+    except ValueError:
+        return jsonify(finish('analyze', start, {'status': 'error', 'message': 'Invalid FEN'}))
+
+    if board.is_game_over():
+        return jsonify(finish('analyze', start, {'status': 'game_over', 'result': get_game_result(board), 'fen': board.fen()}))
+
+    profile_info = {}
+    job = SCHEDULER.submit(
+        engine_call(data, profile_info, time_limit), board.copy(), depth, time_limit, multipv=multipv,
+        client_id=client_id(), game_id=data.get('game_id'), priority=ANALYSIS,
+    )
+    metrics.touch()
+
+    def reply(job):
+        response = reply_lines(job)
+        if profile_info:
+            response['profile_id'] = profile_info['id']
+        return finish('analyze', start, response)
+
+    def reply_lines(job):
+        think_time = time.time() - start
+        if job.state == CANCELLED:
+            return {'status': 'cancelled', 'fen': board.fen()}
+        if job.error:
+            print(f"Engine Error: {job.error}")
+            return {'status': 'error', 'message': str(job.error)}
+
+        return {
+            'status': 'success',
+            'fen': board.fen(),
+            'lines': [{
+                'move': line['move'].uci(),
+                'san': board.san(line['move']),
+                'score': line['score'],
+                'depth': line['depth'],
+                'pv': [m.uci() for m in line['pv']],
+            } for line in job.result],
+            'time': f"{think_time:.2f}s"
+        }
+
+    return stream_job(job, reply)
+
+@app.route('/mate', methods=['POST'])
+def mate():
+    # Proof-number mate search: {fen, max_nodes, max_plies, checks_only} -> mating line
+    start = time.time()
+    data = request.json
+    try:
+        board = chess.Board(data.get('fen')) if data.get('fen') else chess.Board()
+    except ValueError:
+        return jsonify(finish('mate', start, {'status': 'error', 'message': 'Invalid FEN'}))
+
+    if board.is_game_over():
+        return jsonify(finish('mate', start, {'status': 'game_over', 'result': get_game_result(board), 'fen': board.fen()}))
+
+    max_nodes = max(1, min(int(data.get('max_nodes', mate_solver.MAX_NODES)), MATE_MAX_NODES))
+    max_plies = max(1, min(int(data.get('max_plies', mate_solver.MAX_PLIES)), mate_solver.MAX_PLIES))
+    job = SCHEDULER.submit(
+        mate_solver.solve, board.copy(), max_nodes, max_plies, bool(data.get('checks_only', True)),
+        client_id=client_id(), game_id=data.get('game_id'), priority=ANALYSIS,
+    )
+    metrics.touch()
+
+    def reply(job):
+        think_time = time.time() - start
+        if job.state == CANCELLED:
+            response = {'status': 'cancelled', 'fen': board.fen()}
+        elif job.error:
+            print(f"Mate Solver Error: {job.error}")
+            response = {'status': 'error', 'message': str(job.error)}
         else:
-            return jsonify({'status': 'no_move', 'fen': board.fen()})
+            line = job.result['line']
+            response = {
+                'status': 'success',
+                'fen': board.fen(),
+                'result': job.result['result'],      # mate | no_mate | unknown
+                'mate_in': (len(line) + 1) // 2 if line else None,
+                'line': [m.uci() for m in line],
+                'san': board.variation_san(line) if line else '',
+                'nodes': job.result['nodes'],
+                'time': f"{think_time:.2f}s"
+            }
+        return finish('mate', start, response)
 
-    except Exception as e:
-        print(f"Engine Error: {e}")
-        return jsonify({'status': 'error', 'message': str(e)})
+    return stream_job(job, reply)
 
 @app.route('/reset', methods=['POST'])
 def reset():
-    return jsonify({'status': 'reset'})
+    # Stop any search still running for the abandoned game
+    data = request.get_json(silent=True) or {}
+    cancelled = SCHEDULER.cancel_game(data['game_id'], client_id()) if data.get('game_id') else 0
+    return jsonify({'status': 'reset', 'cancelled': cancelled})
+
+@app.route('/cancel', methods=['POST'])
+def cancel():
+    data = request.get_json(silent=True) or {}
+    job_id = data.get('job_id')
+    if not isinstance(job_id, str):
+        return jsonify({'status': 'error', 'message': 'job_id required'})
+    # Someone else's job looks the same as a missing one
+    return jsonify({'status': 'cancelled' if SCHEDULER.cancel(job_id, client_id()) else 'not_found'})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Prometheus text format, summed over all gunicorn workers
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiles', methods=['GET'])
+def profiles():
+    return jsonify({'profiles': profiling.list_profiles()})
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+def profile(profile_id):
+    # ?format=txt (summary, default) | pstats (for snakeviz / pstats) | folded (flamegraph input)
+    ext = {'txt': 'txt', 'pstats': 'prof', 'folded': 'folded'}.get(request.args.get('format', 'txt'))
+    try:
+        path = profiling.profile_path(profile_id, ext) if ext else None
+    except ValueError:
+        path = None
+    if not path or not os.path.exists(path):
+        return jsonify({'status': 'error', 'message': 'Profile not found'}), 404
+    if ext == 'txt':
+        return send_file(os.path.abspath(path), mimetype='text/plain')
+    return send_file(os.path.abspath(path), as_attachment=True)
 
 def get_game_result(board):
     if board.is_checkmate(): return 'Checkmate'
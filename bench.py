@@ -0,0 +1,67 @@
+"""
+Fixed-depth node count / time benchmark for the v3 search.
+
+    python bench.py --depth 4
+    python bench.py --depth 4 --disable futility,late_move
+
+Every position starts from an empty TT and eval cache, so runs are comparable.
+"""
+import argparse
+import contextlib
+import io
+import time
+
+import chess
+
+from versions import my_engine_v3 as engine
+
+BENCH_FENS = [
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 20",
+    "r2q1rk1/pp2bppp/2n1pn2/3p4/3P4/2NBPN2/PP3PPP/R2Q1RK1 w - - 0 20",
+    "r1b2rk1/2q1bppp/p2ppn2/1p6/3BPP2/2N2B2/PPPQ2PP/R4R1K w - - 0 20",
+    "2r3k1/pp3ppp/4p3/3n4/3P4/5N2/PP3PPP/2R3K1 b - - 0 30",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 20",
+    "8/5pk1/6p1/3R4/1r5P/6P1/5PK1/8 w - - 0 45",
+]
+
+
+def reset_engine():
+    engine.TT.clear()
+    engine.killers.clear()
+    engine.RESUME.clear()
+    for i in range(engine.EVAL_CACHE_SIZE):
+        engine.eval_cache_keys[i] = None
+
+
+def run(depth, fens=BENCH_FENS, verbose=True):
+    total_nodes = 0
+    start = time.time()
+    for fen in fens:
+        reset_engine()
+        t = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            move = engine.get_best_move_iterative(chess.Board(fen), depth, use_cache=False)
+        total_nodes += engine.NODES
+        if verbose:
+            print(f"{fen:<75} {str(move):<6} {engine.NODES:>9} nodes {time.time() - t:7.2f}s")
+    elapsed = time.time() - start
+    print(f"total {total_nodes} nodes in {elapsed:.2f}s ({total_nodes / max(elapsed, 1e-9):.0f} nps)")
+    return total_nodes, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixed-depth search benchmark")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--disable", default="", help=f"comma separated, from: {', '.join(engine.PRUNING)}")
+    args = parser.parse_args()
+
+    for name in filter(None, args.disable.split(",")):
+        if name not in engine.PRUNING:
+            parser.error(f"unknown pruning '{name}'")
+        engine.PRUNING[name] = False
+    print("pruning: " + ", ".join(f"{k}={'on' if v else 'off'}" for k, v in engine.PRUNING.items()))
+    run(args.depth)
+
+
+if __name__ == "__main__":
+    main()
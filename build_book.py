@@ -0,0 +1,165 @@
+"""
+Build a Polyglot opening book (.bin) from PGN files.
+
+    python build_book.py games.pgn more.pgn --out my_book.bin --max-ply 24 --min-count 3
+    HALFMIND_BOOKS=my_book.bin:Perfect2021.bin python app.py
+
+Pipeline:
+  1. stream games from PGN (raw text, parsed in worker processes)
+  2. every (position, move) in the first --max-ply plies becomes (zobrist key, move, result)
+  3. counts are aggregated in memory; past --max-entries they are spilled to disk as a sorted run
+  4. the runs are merged (k-way), filtered by --min-count and written as a sorted Polyglot book
+
+Weights follow the usual Polyglot convention: 2 per win + 1 per draw for the side that moved,
+scaled down per position to fit 16 bits. Moves with a zero weight are dropped.
+"""
+import argparse
+import heapq
+import io
+import itertools
+import os
+import struct
+import tempfile
+import time
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+from pgn_stream import map_games
+
+ENTRY = struct.Struct(">QHHI")      # Polyglot: key, move, weight, learn
+RUN = struct.Struct("<QHIII")       # spill record: key, move, games, wins, draws
+RUN_CHUNK = 4096                    # records read per run at a time while merging
+MAX_WEIGHT = 0xFFFF
+
+RESULTS = {"1-0": chess.WHITE, "0-1": chess.BLACK, "1/2-1/2": None}
+
+
+def polyglot_move(board, move):
+    # Castling is stored as king-takes-rook; promotions as 1=N .. 4=Q
+    to_square = move.to_square
+    if board.is_castling(move):
+        rook_file = 7 if board.is_kingside_castling(move) else 0
+        to_square = chess.square(rook_file, chess.square_rank(move.from_square))
+    promotion = move.promotion - 1 if move.promotion else 0
+    return to_square | move.from_square << 6 | promotion << 12
+
+
+def moves_from_game(pgn_text, max_ply, color):
+    """Worker: one game's PGN text -> list of (key, move, win, draw) for the side that moved."""
+    game = chess.pgn.read_game(io.StringIO(pgn_text))
+    if game is None or game.headers.get("Result") not in RESULTS:
+        return []
+    winner = RESULTS[game.headers["Result"]]
+    draw = game.headers["Result"] == "1/2-1/2"
+    out = []
+    board = game.board()
+    if board.chess960:
+        return []
+    for ply, move in enumerate(game.mainline_moves()):
+        if ply >= max_ply:
+            break
+        if color is None or board.turn == color:
+            out.append((chess.polyglot.zobrist_hash(board), polyglot_move(board, move),
+                        int(winner == board.turn), int(draw)))
+        board.push(move)
+    return out
+
+
+def spill(counts, tmpdir):
+    """Write the in-memory counts as one sorted run file; returns its path."""
+    fd, path = tempfile.mkstemp(suffix=".run", dir=tmpdir)
+    with os.fdopen(fd, "wb") as f:
+        for (key, move), (games, wins, draws) in sorted(counts.items()):
+            f.write(RUN.pack(key, move, games, wins, draws))
+    counts.clear()
+    return path
+
+
+def read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(RUN.size * RUN_CHUNK)
+            if not data:
+                break
+            yield from RUN.iter_unpack(data)
+
+
+def merged(runs):
+    """k-way merge of sorted runs, summing records for the same (key, move)."""
+    stream = heapq.merge(*(read_run(p) for p in runs))
+    for (key, move), group in itertools.groupby(stream, key=lambda r: (r[0], r[1])):
+        games = wins = draws = 0
+        for _, _, g, w, d in group:
+            games += g
+            wins += w
+            draws += d
+        yield key, move, games, wins, draws
+
+
+def write_book(records, out, min_count):
+    """records: (key, move, games, wins, draws) sorted by key. Returns (positions, entries)."""
+    positions = entries = 0
+    with open(out, "wb") as f:
+        for key, group in itertools.groupby(records, key=lambda r: r[0]):
+            moves = [(move, 2 * wins + draws) for _, move, games, wins, draws in group if games >= min_count]
+            moves = [(move, weight) for move, weight in moves if weight > 0]
+            if not moves:
+                continue
+            top = max(weight for _, weight in moves)
+            scale = MAX_WEIGHT / top if top > MAX_WEIGHT else 1
+            # Best move first within a position, as Polyglot tools do
+            for move, weight in sorted(moves, key=lambda m: -m[1]):
+                f.write(ENTRY.pack(key, move, max(1, int(weight * scale)), 0))
+                entries += 1
+            positions += 1
+    return positions, entries
+
+
+def build(paths, out, max_ply=24, min_count=2, color=None, max_entries=2000000, processes=None):
+    start = time.time()
+    counts = {}
+    runs = []
+    games = 0
+    with tempfile.TemporaryDirectory(prefix="book-") as tmpdir:
+        for moves in map_games(moves_from_game, paths, max_ply, color, processes=processes):
+            games += 1
+            for key, move, win, draw in moves:
+                c = counts.get((key, move))
+                if c is None:
+                    counts[(key, move)] = [1, win, draw]
+                else:
+                    c[0] += 1
+                    c[1] += win
+                    c[2] += draw
+            if len(counts) >= max_entries:
+                runs.append(spill(counts, tmpdir))
+            if games % 100000 == 0:
+                print(f"[Book] {games} games, {len(runs)} runs spilled")
+        if counts:
+            runs.append(spill(counts, tmpdir))
+        positions, entries = write_book(merged(runs), out, min_count)
+    print(f"[Book] {games} games -> {positions} positions, {entries} moves in {out} "
+          f"({len(runs)} runs, {time.time() - start:.1f}s)")
+    return positions, entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Polyglot opening book from PGN files")
+    parser.add_argument("pgn", nargs="+")
+    parser.add_argument("--out", default="book.bin")
+    parser.add_argument("--max-ply", type=int, default=24, help="only the first N plies of each game")
+    parser.add_argument("--min-count", type=int, default=2, help="drop moves played in fewer games")
+    parser.add_argument("--color", choices=["white", "black"], help="only moves by this side (repertoire books)")
+    parser.add_argument("--max-entries", type=int, default=2000000,
+                        help="(position, move) pairs kept in memory before spilling a sorted run to disk")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    color = {"white": chess.WHITE, "black": chess.BLACK}.get(args.color)
+    build(args.pgn, args.out, args.max_ply, args.min_count, color, args.max_entries, args.processes)
+
+
+if __name__ == "__main__":
+    main()
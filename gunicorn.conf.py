@@ -0,0 +1,17 @@
+# gunicorn -c gunicorn.conf.py app:app   (command-line flags still override these)
+import os
+
+bind = os.environ.get("HALFMIND_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("HALFMIND_WORKERS", "1"))
+threads = 8        # requests wait on the search scheduler, which runs one search at a time
+timeout = 120
+
+# Import the app (engine, tables, book) once in the master; workers are forked from it
+preload_app = os.environ.get("HALFMIND_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded, before any worker is forked
+    if preload_app:
+        import warmup
+        warmup.warm()
@@ -0,0 +1,227 @@
+"""
+Local load test for the Flask service.
+
+Starts gunicorn on a free port, replays game traffic taken from PGN files
+against /move and prints a JSON report (throughput, latency percentiles,
+timeouts, errors by status).
+
+    python loadtest.py --workers 1 --threads 8 --concurrency 4 --requests 100 \\
+        --depth-mix 1:3,2:2,3:1 --time-mix 1:1,5:1 brilliant_move_game.pgn
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import chess
+import chess.pgn
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_mix(text, cast):
+    """'1:3,2:1' -> ([1, 2], [3, 1])  (value:weight, weight defaults to 1)"""
+    values, weights = [], []
+    for part in text.split(","):
+        value, _, weight = part.partition(":")
+        values.append(cast(value))
+        weights.append(float(weight or 1))
+    return values, weights
+
+
+def load_traffic(paths, skip_plies=0):
+    """(fen, human move) pairs from every game: the position before the move plus the move played."""
+    traffic = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            while True:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+                board = game.board()
+                for ply, move in enumerate(game.mainline_moves()):
+                    if ply >= skip_plies:
+                        traffic.append((board.fen(), move.uci()))
+                    board.push(move)
+    if not traffic:
+        raise SystemExit("no positions found in the PGN files")
+    return traffic
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, workers, threads, timeout, extra_env):
+    env = dict(os.environ, **extra_env)
+    cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", str(threads),
+           "-t", str(timeout), "-b", f"127.0.0.1:{port}", "app:app"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("gunicorn exited:\n" + proc.stderr.read().decode(errors="replace"))
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1).read()
+            return proc
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("gunicorn did not come up within 30s")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def send_move(url, payload, timeout):
+    data = json.dumps(payload).encode()
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            body = json.loads(resp.read())
+        return time.perf_counter() - start, body.get("status", "unknown")
+    except socket.timeout:
+        return time.perf_counter() - start, "timeout"
+    except urllib.error.URLError as e:
+        if isinstance(e.reason, socket.timeout):
+            return time.perf_counter() - start, "timeout"
+        return time.perf_counter() - start, "http_error"
+    except (ConnectionError, ValueError):
+        return time.perf_counter() - start, "http_error"
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def run_load(base_url, traffic, n_requests, concurrency, depths, times, timeout, seed=0):
+    rng = random.Random(seed)
+    jobs = []
+    for _ in range(n_requests):
+        fen, move = rng.choice(traffic)
+        jobs.append({
+            "fen": fen,
+            "move": move,
+            "depth": rng.choices(*depths)[0],
+            "time_limit": rng.choices(*times)[0],
+        })
+
+    results = []
+    lock = threading.Lock()
+
+    def worker(payload):
+        latency, status = send_move(base_url + "/move", payload, timeout)
+        with lock:
+            results.append((latency, status, payload["depth"], payload["time_limit"]))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, jobs))
+    return results, time.perf_counter() - start
+
+
+def report(results, elapsed, config):
+    statuses = Counter(status for _, status, _, _ in results)
+    ok = sorted(lat for lat, status, _, _ in results if status in ("success", "game_over", "no_move"))
+    all_latencies = sorted(lat for lat, _, _, _ in results)
+
+    def summary(latencies):
+        return {
+            "count": len(latencies),
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+        }
+
+    by_depth = {}
+    for depth in sorted({d for _, _, d, _ in results}):
+        by_depth[str(depth)] = summary(sorted(lat for lat, s, d, _ in results if d == depth and s != "timeout"))
+
+    return {
+        "config": config,
+        "requests": len(results),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(results) / elapsed if elapsed else None,
+        "statuses": dict(statuses),
+        "timeouts": statuses.get("timeout", 0),
+        "errors": sum(n for s, n in statuses.items() if s in ("error", "http_error", "illegal", "unknown")),
+        "latency_s": summary(ok),
+        "latency_all_s": summary(all_latencies),
+        "latency_by_depth_s": by_depth,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test app.py /move under gunicorn")
+    parser.add_argument("pgn", nargs="*", default=[os.path.join(ROOT, "brilliant_move_game.pgn")])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--depth-mix", default="1:1,2:2,3:1", help="depth:weight,...")
+    parser.add_argument("--time-mix", default="1:1,5:1", help="time_limit:weight,...")
+    parser.add_argument("--timeout", type=float, default=60, help="client-side timeout per request (s)")
+    parser.add_argument("--skip-plies", type=int, default=0, help="ignore the first plies of each game")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    traffic = load_traffic(args.pgn, args.skip_plies)
+    depths = parse_mix(args.depth_mix, int)
+    times = parse_mix(args.time_mix, float)
+
+    # Fresh analysis cache per run, so results don't depend on earlier runs, and private
+    # metrics, so synthetic traffic doesn't end up in the counters a real server exports.
+    # Both live in a temp dir that is removed once the server is down.
+    run_dir = tempfile.TemporaryDirectory(prefix="halfmind-loadtest-")
+    env = {"HALFMIND_CACHE_PATH": os.path.join(run_dir.name, "analysis_cache.sqlite3"),
+           "HALFMIND_METRICS_DIR": os.path.join(run_dir.name, "metrics")}
+
+    port = free_port()
+    try:
+        server = start_server(port, args.workers, args.threads, int(args.timeout * 2), env)
+        try:
+            results, elapsed = run_load(f"http://127.0.0.1:{port}", traffic, args.requests,
+                                        args.concurrency, depths, times, args.timeout, args.seed)
+        finally:
+            stop_server(server)
+    finally:
+        run_dir.cleanup()
+
+    config = {k: v for k, v in vars(args).items() if k != "out"}
+    config["positions"] = len(traffic)
+    result = report(results, elapsed, config)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
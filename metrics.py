@@ -0,0 +1,213 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from scheduler import SCHEDULER
+from versions import my_engine_v3 as engine
+
+# Prometheus-style metrics, aggregated across gunicorn worker processes.
+# Every worker keeps its own counters and writes them to METRICS_DIR/<pid>.json after each
+# update; GET /metrics (served by any worker) sums all the files. Counters of workers that
+# have exited are kept; gauges only come from live workers.
+# Clear METRICS_DIR on deploy if counters shouldn't carry over between restarts.
+
+METRICS_DIR = os.environ.get("HALFMIND_METRICS_DIR") or os.path.join(tempfile.gettempdir(), "halfmind-metrics")
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60]
+DEPTH_BUCKETS = list(range(0, 21))
+OVERRUN_SLACK = 0.25   # seconds past time_limit before a search counts as overrunning
+
+HELP = {
+    "halfmind_requests_total": ("counter", "Requests by endpoint and reply status"),
+    "halfmind_request_seconds": ("histogram", "Time from request to reply, including queueing"),
+    "halfmind_search_seconds": ("histogram", "Engine time per search, by source (book/cache/resume/search)"),
+    "halfmind_search_depth": ("histogram", "Depth reached per search, by source"),
+    "halfmind_searches_total": ("counter", "Searches by source (book/cache/resume/search)"),
+    "halfmind_search_nodes_total": ("counter", "Nodes searched"),
+    "halfmind_search_aborted_total": ("counter", "Searches stopped before finishing (cancelled)"),
+    "halfmind_time_limit_exceeded_total": ("counter", "Searches that ran past time_limit + slack"),
+    "halfmind_nodes_per_second": ("gauge", "Nodes per second of engine time, all workers"),
+    "halfmind_book_hit_rate": ("gauge", "Share of engine calls answered by the opening book"),
+    "halfmind_tt_fill_ratio": ("gauge", "Transposition table entries / TT_MAX_ENTRIES, per worker"),
+    "halfmind_queue_depth": ("gauge", "Searches queued or running, all workers"),
+    "halfmind_workers": ("gauge", "Live worker processes reporting metrics"),
+}
+
+_lock = threading.Lock()
+_state = None
+
+
+def _path(pid):
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def _load():
+    # Per-process state, picking up an old file if this pid was used before
+    global _state
+    if _state is None:
+        _state = {"counters": {}, "histograms": {}, "gauges": {}}
+        try:
+            with open(_path(os.getpid())) as f:
+                old = json.load(f)
+            _state["counters"] = old.get("counters", {})
+            _state["histograms"] = old.get("histograms", {})
+        except (OSError, ValueError):
+            pass
+    return _state
+
+
+def _labels(**labels):
+    return ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+
+
+def _inc(state, name, value=1, **labels):
+    series = state["counters"].setdefault(name, {})
+    key = _labels(**labels)
+    series[key] = series.get(key, 0) + value
+
+
+def _observe(state, name, value, buckets, **labels):
+    # [count per bucket..., count above the last bucket, sum]
+    series = state["histograms"].setdefault(name, {})
+    key = _labels(**labels)
+    h = series.setdefault(key, [0] * (len(buckets) + 2))
+    i = next((i for i, b in enumerate(buckets) if value <= b), len(buckets))
+    h[i] += 1
+    h[-1] += value
+
+
+def _flush(state):
+    state["gauges"] = {
+        "halfmind_tt_fill_ratio": len(engine.TT) / engine.TT_MAX_ENTRIES,
+        "halfmind_queue_depth": SCHEDULER.queue_depth(),
+    }
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    tmp = _path(os.getpid()) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, _path(os.getpid()))
+
+
+def record_request(endpoint, status, seconds=None):
+    with _lock:
+        state = _load()
+        _inc(state, "halfmind_requests_total", endpoint=endpoint, status=status)
+        if seconds is not None:
+            _observe(state, "halfmind_request_seconds", seconds, LATENCY_BUCKETS, endpoint=endpoint)
+        _flush(state)
+
+
+def record_search(seconds, time_limit, info):
+    with _lock:
+        state = _load()
+        source = info.get("source", "search")
+        _inc(state, "halfmind_searches_total", source=source)
+        _inc(state, "halfmind_search_nodes_total", info.get("nodes", 0))
+        _observe(state, "halfmind_search_seconds", seconds, LATENCY_BUCKETS, source=source)
+        _observe(state, "halfmind_search_depth", info.get("depth", 0), DEPTH_BUCKETS, source=source)
+        if info.get("aborted"):
+            _inc(state, "halfmind_search_aborted_total")
+        if seconds > time_limit + OVERRUN_SLACK:
+            _inc(state, "halfmind_time_limit_exceeded_total")
+        _flush(state)
+
+
+def touch():
+    # Refresh this worker's gauges (e.g. after queueing a search)
+    with _lock:
+        _flush(_load())
+
+
+def observed(fn, time_limit):
+    # Wraps an engine call handed to the scheduler; records it on the worker thread,
+    # right after the search, so engine.LAST_SEARCH still belongs to it
+    def wrapper(*args, **kwargs):
+        engine.LAST_SEARCH.clear()
+        start = time.time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            record_search(time.time() - start, time_limit, dict(engine.LAST_SEARCH))
+    return wrapper
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """Sum of every worker's metrics: (counters, histograms, live gauges by pid)."""
+    counters, histograms, gauges = {}, {}, {}
+    if not os.path.isdir(METRICS_DIR):
+        return counters, histograms, gauges
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                state = json.load(f)
+            pid = int(name[:-5])
+        except (OSError, ValueError):
+            continue
+        for metric, series in state.get("counters", {}).items():
+            total = counters.setdefault(metric, {})
+            for key, value in series.items():
+                total[key] = total.get(key, 0) + value
+        for metric, series in state.get("histograms", {}).items():
+            total = histograms.setdefault(metric, {})
+            for key, h in series.items():
+                total[key] = [a + b for a, b in zip(total[key], h)] if key in total else list(h)
+        if _alive(pid):
+            gauges[pid] = state.get("gauges", {})
+    return counters, histograms, gauges
+
+
+def _series(name, labels, value):
+    return f"{name}{{{labels}}} {value}" if labels else f"{name} {value}"
+
+
+def render():
+    """Prometheus text exposition format."""
+    counters, histograms, gauges = collect()
+
+    searches = counters.get("halfmind_searches_total", {})
+    total_searches = sum(searches.values())
+    search_time = sum(h[-1] for key, h in histograms.get("halfmind_search_seconds", {}).items()
+                      if 'source="search"' in key)
+    derived = {
+        "halfmind_nodes_per_second": {"": sum(counters.get("halfmind_search_nodes_total", {}).values()) / search_time
+                                      if search_time else 0},
+        "halfmind_book_hit_rate": {"": searches.get(_labels(source="book"), 0) / total_searches
+                                   if total_searches else 0},
+        "halfmind_tt_fill_ratio": {_labels(pid=pid): g.get("halfmind_tt_fill_ratio", 0) for pid, g in gauges.items()},
+        "halfmind_queue_depth": {"": sum(g.get("halfmind_queue_depth", 0) for g in gauges.values())},
+        "halfmind_workers": {"": len(gauges)},
+    }
+
+    lines = []
+    for name, (kind, text) in HELP.items():
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            buckets = DEPTH_BUCKETS if name == "halfmind_search_depth" else LATENCY_BUCKETS
+            for key, h in sorted(histograms.get(name, {}).items()):
+                cumulative = 0
+                for bound, count in zip(buckets + ["+Inf"], h[:-1]):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(_series(name + "_bucket", f"{key},{le}" if key else le, cumulative))
+                lines.append(_series(name + "_sum", key, h[-1]))
+                lines.append(_series(name + "_count", key, cumulative))
+        else:
+            series = counters.get(name) if kind == "counter" else derived.get(name)
+            for key, value in sorted((series or {}).items()):
+                lines.append(_series(name, key, value))
+    return "\n".join(lines) + "\n"
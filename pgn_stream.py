@@ -0,0 +1,36 @@
+"""
+PGN streaming for the offline tools (tune.py, build_book.py).
+
+Games are split on their headers as raw text; parsing happens in worker
+processes, so the parent only reads the files.
+
+    for result in map_games(fn, ["games.pgn"], arg1, arg2):   # fn(pgn_text, arg1, arg2) per game
+        ...
+"""
+import functools
+import multiprocessing
+
+
+def stream_games(paths):
+    # Split raw text on headers; parsing happens in the workers
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            chunk = []
+            for line in f:
+                if line.startswith("[Event ") and chunk:
+                    yield "".join(chunk)
+                    chunk = []
+                chunk.append(line)
+            if chunk:
+                yield "".join(chunk)
+
+
+def _call(fn, args, pgn_text):
+    return fn(pgn_text, *args)
+
+
+def map_games(fn, paths, *args, processes=None, chunksize=64):
+    """fn(pgn_text, *args) for every game in a process pool, yielded as they finish (unordered).
+    `fn` must be a module-level function. Closing the generator terminates the pool."""
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap_unordered(functools.partial(_call, fn, args), stream_games(paths), chunksize)
@@ -0,0 +1,207 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+import chess
+
+# Opt-in profiling of engine searches.
+#   - per request:   {"profile": true} on /move or /analyze, honoured only with HALFMIND_PROFILE_REQUESTS=1
+#   - sampled:       HALFMIND_PROFILE_RATE=0.01 profiles ~1% of requests
+#   - per call:      run_profiled(get_best_move_iterative, board, depth, time_limit)
+# Output goes to PROFILE_DIR/<id>.prof (pstats), <id>.txt (summary), <id>.folded (sample mode).
+# Only the newest PROFILE_KEEP profiles are kept. When off, the only cost is the should_profile() check.
+
+PROFILE_DIR = os.environ.get("HALFMIND_PROFILE_DIR", "profiles")
+PROFILE_RATE = float(os.environ.get("HALFMIND_PROFILE_RATE", "0") or 0)
+PROFILE_REQUESTS = os.environ.get("HALFMIND_PROFILE_REQUESTS", "0") == "1"
+PROFILE_KEEP = int(os.environ.get("HALFMIND_PROFILE_KEEP", "50"))
+SAMPLE_INTERVAL = 0.001     # seconds between stack samples in "sample" mode
+
+ENGINE_FUNCS = ["get_best_move_iterative", "get_best_move_v3", "minimax", "quiescence",
+                "sort_moves", "evaluate_board", "static_eval"]
+CHESS_DIR = os.path.dirname(chess.__file__)
+PROFILE_ID = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$")
+
+
+def should_profile(requested=False, rate=None):
+    # Clients can only ask for a profile when the server allows it (each one writes files)
+    rate = PROFILE_RATE if rate is None else rate
+    return (bool(requested) and PROFILE_REQUESTS) or (rate > 0 and random.random() < rate)
+
+
+def new_profile_id():
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+
+def profile_path(profile_id, ext):
+    if not PROFILE_ID.match(profile_id or ""):
+        raise ValueError("bad profile id")
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{ext}")
+
+
+def run_profiled(fn, *args, mode="cprofile", skip_if=None, **kwargs):
+    """
+    Run fn under a profiler; returns (result, profile_id).
+    If skip_if() is true afterwards (e.g. nothing was searched), nothing is written and the id is None.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = new_profile_id()
+    start = time.time()
+
+    if mode == "sample":
+        sampler = StackSampler(threading.get_ident())
+        sampler.start()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            sampler.stop()
+        if skip_if is not None and skip_if():
+            return result, None
+        with open(profile_path(profile_id, "folded"), "w") as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        summary = sampler.summary(time.time() - start)
+    else:
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            prof.disable()
+        if skip_if is not None and skip_if():
+            return result, None
+        prof.dump_stats(profile_path(profile_id, "prof"))
+        summary = summarize(pstats.Stats(prof), time.time() - start)
+
+    with open(profile_path(profile_id, "txt"), "w") as f:
+        f.write(summary)
+    print(f"[Profile] {profile_id} ({time.time() - start:.2f}s)")
+    prune(PROFILE_KEEP)
+    return result, profile_id
+
+
+def prune(keep):
+    # Drop all but the newest `keep` profiles (by file time: ids only have second resolution).
+    # Other workers may be pruning too.
+    files, mtimes = {}, {}
+    for name in os.listdir(PROFILE_DIR):
+        profile_id = name.split(".", 1)[0]
+        if PROFILE_ID.match(profile_id):
+            try:
+                mtime = os.path.getmtime(os.path.join(PROFILE_DIR, name))
+            except FileNotFoundError:
+                continue
+            files.setdefault(profile_id, []).append(name)
+            mtimes[profile_id] = max(mtimes.get(profile_id, 0), mtime)
+    for profile_id in sorted(files, key=mtimes.get, reverse=True)[keep:]:
+        for name in files[profile_id]:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+def profiled(fn, info, mode="cprofile", skip_if=None):
+    # Wraps fn so it can be handed to the scheduler; the profile id ends up in info['id']
+    def wrapper(*args, **kwargs):
+        result, profile_id = run_profiled(fn, *args, mode=mode, skip_if=skip_if, **kwargs)
+        if profile_id:
+            info["id"] = profile_id
+        return result
+    return wrapper
+
+
+def summarize(stats, wall_time):
+    out = io.StringIO()
+    out.write(f"wall time {wall_time:.3f}s, profiled time {stats.total_tt:.3f}s\n\n")
+    out.write(f"{'function':<26}{'calls':>10}{'own s':>10}{'total s':>10}\n")
+
+    by_name = {}
+    chess_own = 0.0
+    chess_funcs = []
+    for (filename, line, name), (cc, nc, tt, ct, callers) in stats.stats.items():
+        if name in ENGINE_FUNCS and filename.endswith(".py") and "versions" in filename:
+            calls, own, total = by_name.get(name, (0, 0.0, 0.0))
+            by_name[name] = (calls + nc, own + tt, max(total, ct))
+        elif filename.startswith(CHESS_DIR):
+            chess_own += tt
+            chess_funcs.append((tt, nc, name))
+
+    for name in ENGINE_FUNCS:
+        if name in by_name:
+            calls, own, total = by_name[name]
+            out.write(f"{name:<26}{calls:>10}{own:>10.3f}{total:>10.3f}\n")
+    out.write(f"{'python-chess (all)':<26}{'':>10}{chess_own:>10.3f}\n\n")
+
+    out.write("python-chess hot spots (own time):\n")
+    for tt, nc, name in sorted(chess_funcs, reverse=True)[:15]:
+        out.write(f"  {name:<30}{nc:>10}{tt:>10.3f}\n")
+
+    out.write("\nTop 25 by cumulative time:\n")
+    stats.stream = out
+    stats.sort_stats("cumulative").print_stats(25)
+    return out.getvalue()
+
+
+class StackSampler:
+    """Samples one thread's Python stack every SAMPLE_INTERVAL (collapsed-stack output)."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def _run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                prefix = "chess." if code.co_filename.startswith(CHESS_DIR) else ""
+                stack.append(prefix + code.co_name)
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def summary(self, wall_time):
+        total = sum(self.stacks.values()) or 1
+        inclusive = Counter()
+        own = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own["python-chess (all)" if frames[-1].startswith("chess.") else frames[-1]] += count
+            for name in set("python-chess (all)" if n.startswith("chess.") else n for n in frames):
+                inclusive[name] += count
+        out = io.StringIO()
+        out.write(f"wall time {wall_time:.3f}s, {total} samples\n\n")
+        out.write(f"{'function':<26}{'own %':>10}{'total %':>10}\n")
+        for name in ENGINE_FUNCS + ["python-chess (all)"]:
+            if inclusive[name] or own[name]:
+                out.write(f"{name:<26}{100 * own[name] / total:>10.1f}{100 * inclusive[name] / total:>10.1f}\n")
+        return out.getvalue()
+
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted((f[:-4] for f in os.listdir(PROFILE_DIR) if f.endswith(".txt")), reverse=True)
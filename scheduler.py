@@ -0,0 +1,144 @@
+import itertools
+import secrets
+import threading
+import time
+
+# Priority tiers (lower runs first)
+INTERACTIVE = 0     # a player is waiting for the engine's move
+ANALYSIS = 1        # /analyze requests
+BATCH = 2           # background / tooling work
+
+QUEUED, RUNNING, DONE, CANCELLED = "queued", "running", "done", "cancelled"
+
+
+class SearchJob:
+    def __init__(self, job_id, seq, fn, args, kwargs, client_id, game_id, priority):
+        self.id = job_id                    # unguessable: it is what /cancel takes
+        self.seq = seq                      # submission order (FIFO tie-break)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.client_id = client_id
+        self.game_id = game_id
+        self.priority = priority
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.stop = threading.Event()       # handed to the engine as `stop=`
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+
+class SearchScheduler:
+    """
+    Runs engine searches one at a time on a single worker thread
+    (the engine's TT / killers are module globals, so searches can't overlap).
+
+    Jobs are picked by priority tier first, then by the client that has used
+    the least engine time so far, then FIFO. A job is cancelled explicitly,
+    when a newer job arrives for the same game, or when its HTTP client goes away.
+    Only the client that submitted a job can cancel it or supersede it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.queue = []
+        self.jobs = {}              # id -> job (queued or running)
+        self.running = None
+        self.usage = {}             # client_id -> seconds of engine time used
+        self.seq = itertools.count(1)
+        self.worker = None
+
+    def _ensure_worker(self):
+        # Started lazily so a pre-fork master never owns the thread
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self._run, name="search-worker", daemon=True)
+            self.worker.start()
+
+    def submit(self, fn, *args, client_id=None, game_id=None, priority=INTERACTIVE, **kwargs):
+        with self.lock:
+            self._ensure_worker()
+            if game_id is not None:
+                # A newer request for the same game (and kind) from the same client supersedes older ones
+                for job in list(self.jobs.values()):
+                    if job.game_id == game_id and job.priority == priority and job.client_id == client_id:
+                        self._cancel(job)
+            job = SearchJob(secrets.token_hex(16), next(self.seq), fn, args, kwargs,
+                            client_id, game_id, priority)
+            self.jobs[job.id] = job
+            self.queue.append(job)
+            self.wakeup.notify()
+            return job
+
+    def cancel(self, job_id, client_id=None):
+        # client_id None: the server itself (e.g. the HTTP client went away)
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or (client_id is not None and job.client_id != client_id):
+                return False
+            self._cancel(job)
+            return True
+
+    def cancel_game(self, game_id, client_id):
+        with self.lock:
+            jobs = [j for j in self.jobs.values() if j.game_id == game_id and j.client_id == client_id]
+            for job in jobs:
+                self._cancel(job)
+            return len(jobs)
+
+    def _cancel(self, job):
+        # Caller holds the lock
+        job.stop.set()
+        if job.state == QUEUED:
+            self.queue.remove(job)
+            self._finish(job, CANCELLED)
+        # A running job finishes (and is marked cancelled) once the engine notices `stop`
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished = time.time()
+        self.jobs.pop(job.id, None)
+        job.done.set()
+
+    def queue_depth(self):
+        with self.lock:
+            return len(self.queue) + (1 if self.running else 0)
+
+    def _next_job(self):
+        return min(
+            self.queue,
+            key=lambda j: (j.priority, self.usage.get(j.client_id, 0.0), j.seq),
+        )
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.queue:
+                    self.wakeup.wait()
+                job = self._next_job()
+                self.queue.remove(job)
+                job.state = RUNNING
+                job.started = time.time()
+                self.running = job
+
+            try:
+                result, error = job.fn(*job.args, stop=job.stop, **job.kwargs), None
+            except Exception as e:
+                result, error = None, e
+
+            with self.lock:
+                self.running = None
+                used = time.time() - job.started
+                if len(self.usage) > 10000: self.usage.clear()
+                self.usage[job.client_id] = self.usage.get(job.client_id, 0.0) + used
+                job.result, job.error = result, error
+                self._finish(job, CANCELLED if job.stop.is_set() else DONE)
+
+
+SCHEDULER = SearchScheduler()
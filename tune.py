@@ -0,0 +1,278 @@
+"""
+Texel tuning for the v3 evaluation (piece values, PSTs, passed pawn bonus, mobility, king attack).
+
+    python tune.py games1.pgn games2.pgn --out versions/tuned_params.py
+
+Pipeline:
+  1. stream games from PGN (read as raw text, parsed in worker processes)
+  2. quiesce each sampled position down to a quiet leaf
+  3. turn the leaf into sparse linear features (the v3 eval is linear in its parameters)
+  4. fit all parameters to the game results with a vectorised NumPy loss / gradient
+  5. write a parameter module
+
+Needs numpy (not required by the web app).
+"""
+import argparse
+import io
+import itertools
+import math
+import os
+import time
+from array import array
+
+import chess
+import chess.pgn
+import numpy as np
+
+from pgn_stream import map_games
+from versions import my_engine_v3 as engine
+
+# --- PARAMETER LAYOUT ---
+# [0:5]      PIECE_VALUES for P N B R Q
+# [5:453]    7 PSTs x 64 (white's point of view, a8 = index 0 like the engine tables)
+# [453]      PASSED_PAWN_BONUS
+# [454:458]  MOBILITY_WEIGHTS for N B R Q
+# [458]      KING_ATTACK_WEIGHT
+
+PIECES = [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]
+TABLES = ["pawntable", "knightstable", "bishoptable", "rooktable", "queentable", "kingtable", "king_endgame_table"]
+TABLE_FOR_PIECE = {chess.PAWN: 0, chess.KNIGHT: 1, chess.BISHOP: 2, chess.ROOK: 3, chess.QUEEN: 4}
+KING_MG, KING_EG = 5, 6
+VALUE_OFFSET = 0
+TABLE_OFFSET = 5
+PASSED_OFFSET = TABLE_OFFSET + 64 * len(TABLES)
+MOBILITY_PIECES = [chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]
+MOBILITY_OFFSET = PASSED_OFFSET + 1
+KING_ATTACK_OFFSET = MOBILITY_OFFSET + len(MOBILITY_PIECES)
+N_PARAMS = KING_ATTACK_OFFSET + 1
+
+RESULTS = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+
+def initial_params():
+    w = np.zeros(N_PARAMS)
+    for i, p in enumerate(PIECES):
+        w[VALUE_OFFSET + i] = engine.PIECE_VALUES[p]
+    for t, name in enumerate(TABLES):
+        w[TABLE_OFFSET + 64 * t: TABLE_OFFSET + 64 * (t + 1)] = getattr(engine, name)
+    w[PASSED_OFFSET] = engine.PASSED_PAWN_BONUS
+    for i, p in enumerate(MOBILITY_PIECES):
+        w[MOBILITY_OFFSET + i] = engine.MOBILITY_WEIGHTS[p]
+    w[KING_ATTACK_OFFSET] = engine.KING_ATTACK_WEIGHT
+    return w
+
+
+def features(board: chess.Board):
+    """Sparse (columns, coefficients) with evaluate_board(board) == coef . params."""
+    cols, vals = [], []
+    is_eg = engine.is_endgame(board)
+    for square, piece in board.piece_map().items():
+        sign = 1 if piece.color == chess.WHITE else -1
+        index = chess.square_mirror(square) if piece.color == chess.WHITE else square
+        if piece.piece_type == chess.KING:
+            table = KING_EG if is_eg else KING_MG
+        else:
+            table = TABLE_FOR_PIECE[piece.piece_type]
+            cols.append(VALUE_OFFSET + PIECES.index(piece.piece_type))
+            vals.append(sign)
+        cols.append(TABLE_OFFSET + 64 * table + index)
+        vals.append(sign)
+        if piece.piece_type == chess.PAWN and engine.is_passed_pawn(board, square, piece.color):
+            rank = chess.square_rank(square)
+            cols.append(PASSED_OFFSET)
+            vals.append(rank - 1 if piece.color == chess.WHITE else -(6 - rank))
+        if piece.piece_type in MOBILITY_PIECES:
+            attacks = board.attacks_mask(square)
+            cols.append(MOBILITY_OFFSET + MOBILITY_PIECES.index(piece.piece_type))
+            vals.append(sign * (chess.popcount(attacks & ~board.occupied_co[piece.color])
+                                - engine.MOBILITY_BASE[piece.piece_type]))
+            king = board.king(not piece.color)
+            if not is_eg and king is not None:
+                cols.append(KING_ATTACK_OFFSET)
+                vals.append(sign * chess.popcount(attacks & engine.KING_ZONE[king]))
+    return cols, vals
+
+
+def quiet_leaf(board: chess.Board, alpha=-math.inf, beta=math.inf, depth=0):
+    """Captures-only negamax; returns (score for side to move, quiet leaf board)."""
+    stand_pat = engine.evaluate_board(board) * (1 if board.turn else -1)
+    if depth >= 6 or stand_pat >= beta:
+        return stand_pat, board.copy(stack=False)
+    alpha = max(alpha, stand_pat)
+    best_leaf = None
+    for move in list(board.generate_legal_captures()):
+        board.push(move)
+        score, leaf = quiet_leaf(board, -beta, -alpha, depth + 1)
+        board.pop()
+        score = -score
+        if score >= beta:
+            return score, leaf
+        if score > alpha:
+            alpha, best_leaf = score, leaf
+    return alpha, best_leaf or board.copy(stack=False)
+
+
+def positions_from_game(pgn_text, skip_plies, every):
+    """Worker: one game's PGN text -> list of (cols, vals, result)."""
+    game = chess.pgn.read_game(io.StringIO(pgn_text))
+    if game is None:
+        return []
+    result = RESULTS.get(game.headers.get("Result"))
+    if result is None:
+        return []
+    out = []
+    board = game.board()
+    for ply, move in enumerate(game.mainline_moves()):
+        board.push(move)
+        if ply < skip_plies or ply % every or board.is_check() or board.is_game_over():
+            continue
+        _, leaf = quiet_leaf(board.copy(stack=False))
+        # Bitbase / terminal scores aren't part of the linear eval
+        if chess.popcount(leaf.occupied) <= engine.BITBASE_PIECES or leaf.is_game_over():
+            continue
+        cols, vals = features(leaf)
+        out.append((cols, vals, result))
+    return out
+
+
+def build_dataset(paths, skip_plies=16, every=1, processes=None, limit=None):
+    # Flat growing buffers: ~4 bytes per feature instead of numpy arrays per position
+    rows, cols, vals, labels = array("i"), array("i"), array("f"), array("d")
+    n = reported = 0
+    games = map_games(positions_from_game, paths, skip_plies, every, processes=processes)
+    for positions in games:
+        for c, v, result in positions:
+            rows.extend(itertools.repeat(n, len(c)))
+            cols.extend(c)
+            vals.extend(v)
+            labels.append(result)
+            n += 1
+        if limit and n >= limit:
+            games.close()   # terminates the pool
+            break
+        if n >= reported + 100000:
+            reported = n
+            print(f"[Tune] {n} positions")
+    if not n:
+        raise SystemExit("no usable positions found")
+    return (np.frombuffer(rows, dtype=np.int32), np.frombuffer(cols, dtype=np.int32),
+            np.frombuffer(vals, dtype=np.float32), np.frombuffer(labels, dtype=np.float64))
+
+
+# --- LOSS ---
+
+def evaluate_all(w, rows, cols, vals, n):
+    return np.bincount(rows, weights=vals * w[cols], minlength=n)
+
+
+def sigmoid(evals, k):
+    return 1.0 / (1.0 + np.power(10.0, -k * evals / 400.0))
+
+
+def loss(w, k, data):
+    rows, cols, vals, y = data
+    s = sigmoid(evaluate_all(w, rows, cols, vals, len(y)), k)
+    return np.mean((y - s) ** 2)
+
+
+def gradient(w, k, data):
+    rows, cols, vals, y = data
+    s = sigmoid(evaluate_all(w, rows, cols, vals, len(y)), k)
+    # d/de of mean (y - s)^2
+    g = 2.0 * (s - y) * s * (1.0 - s) * (k * math.log(10) / 400.0) / len(y)
+    return np.bincount(cols, weights=vals * g[rows], minlength=len(w))
+
+
+def fit_k(w, data):
+    # Golden-section search for the scaling constant with the current parameters
+    lo, hi = 0.1, 3.0
+    ratio = (math.sqrt(5) - 1) / 2
+    for _ in range(40):
+        a, b = hi - ratio * (hi - lo), lo + ratio * (hi - lo)
+        if loss(w, a, data) < loss(w, b, data):
+            hi = b
+        else:
+            lo = a
+    return (lo + hi) / 2
+
+
+def tune(w, data, k, epochs=2000, lr=1.0):
+    # Adam: parameters live on very different scales (piece values vs PST entries)
+    m = np.zeros_like(w)
+    v = np.zeros_like(w)
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    fixed = np.zeros_like(w, dtype=bool)
+    fixed[VALUE_OFFSET] = True   # pawn = 100 anchors the scale
+    for t in range(1, epochs + 1):
+        g = gradient(w, k, data)
+        g[fixed] = 0.0
+        m = beta1 * m + (1 - beta1) * g
+        v = beta2 * v + (1 - beta2) * g * g
+        w -= lr * (m / (1 - beta1 ** t)) / (np.sqrt(v / (1 - beta2 ** t)) + eps)
+        if t % 100 == 0:
+            print(f"[Tune] epoch {t} loss {loss(w, k, data):.6f}")
+    return w
+
+
+# --- OUTPUT ---
+
+def write_module(w, path):
+    w = np.rint(w).astype(int)
+    lines = [
+        '"""Evaluation parameters produced by tune.py (Texel tuning). Do not edit by hand."""',
+        "import chess",
+        "",
+        "PIECE_VALUES = {",
+    ]
+    for i, p in enumerate(PIECES):
+        lines.append(f"    chess.{chess.piece_name(p).upper()}: {w[VALUE_OFFSET + i]},")
+    lines += ["    chess.KING: 0,", "}", ""]
+    for t, name in enumerate(TABLES):
+        table = w[TABLE_OFFSET + 64 * t: TABLE_OFFSET + 64 * (t + 1)]
+        lines.append(f"{name} = [")
+        for r in range(8):
+            lines.append("    " + ", ".join(f"{x:4d}" for x in table[8 * r: 8 * r + 8]) + ",")
+        lines += ["]", ""]
+    lines.append(f"PASSED_PAWN_BONUS = {w[PASSED_OFFSET]}")
+    lines.append("MOBILITY_WEIGHTS = {" + ", ".join(
+        f"chess.{chess.piece_name(p).upper()}: {w[MOBILITY_OFFSET + i]}" for i, p in enumerate(MOBILITY_PIECES)) + "}")
+    lines.append(f"KING_ATTACK_WEIGHT = {w[KING_ATTACK_OFFSET]}")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Texel-tune the v3 evaluation")
+    parser.add_argument("pgn", nargs="+", help="PGN files with game results")
+    parser.add_argument("--out", default="versions/tuned_params.py")
+    parser.add_argument("--epochs", type=int, default=2000)
+    parser.add_argument("--lr", type=float, default=1.0)
+    parser.add_argument("--skip-plies", type=int, default=16, help="ignore the opening (book) plies")
+    parser.add_argument("--every", type=int, default=1, help="sample every Nth ply")
+    parser.add_argument("--limit", type=int, help="stop after this many positions")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--features", help="cache extracted features in this .npz (reused if present)")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.features and os.path.exists(args.features):
+        f = np.load(args.features)
+        data = (f["rows"], f["cols"], f["vals"], f["y"])
+    else:
+        data = build_dataset(args.pgn, args.skip_plies, args.every, args.processes, args.limit)
+        if args.features:
+            np.savez(args.features, rows=data[0], cols=data[1], vals=data[2], y=data[3])
+    print(f"[Tune] {len(data[3])} positions, {len(data[0])} features in {time.time() - start:.1f}s")
+
+    w = initial_params()
+    k = fit_k(w, data)
+    print(f"[Tune] K = {k:.3f}, start loss {loss(w, k, data):.6f}")
+    w = tune(w, data, k, args.epochs, args.lr)
+    print(f"[Tune] final loss {loss(w, k, data):.6f} after {time.time() - start:.1f}s")
+
+    write_module(w, args.out)
+    print(f"[Tune] wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import chess
+import chess.polyglot
+
+# Two tiers:
+#   1. Hot in-memory LRU (per process, microsecond lookups)
+#   2. SQLite file (survives restarts, shared by every gunicorn worker)
+#
+# One row per position. We keep the DEEPEST result seen, because a result
+# searched to depth N also answers any request for depth <= N.
+
+CACHE_PATH = os.environ.get("HALFMIND_CACHE_PATH", "analysis_cache.sqlite3")
+LRU_SIZE = 50000
+
+
+def position_hash(board: chess.Board):
+    # Polyglot Zobrist hash -> stable across processes and restarts
+    # (python's hash() is salted per process, so it can't go to disk)
+    # SQLite INTEGER is signed 64-bit, so fold into that range
+    h = chess.polyglot.zobrist_hash(board)
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+
+class AnalysisCache:
+    def __init__(self, path=CACHE_PATH, lru_size=LRU_SIZE):
+        self.path = path
+        self.lru_size = lru_size
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = None
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        # Opened lazily (and per process) so a forked worker never
+        # inherits its parent's sqlite handle
+        if self.db is None and self.path:
+            try:
+                self.db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+                self.db.execute("PRAGMA journal_mode=WAL")
+                self.db.execute("PRAGMA synchronous=NORMAL")
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS analysis ("
+                    " key INTEGER PRIMARY KEY,"
+                    " move TEXT NOT NULL,"
+                    " score REAL,"
+                    " depth INTEGER NOT NULL,"        # depth actually completed
+                    " max_depth INTEGER NOT NULL,"    # depth that was requested
+                    " time_limit REAL NOT NULL,"      # time budget it was given
+                    " created REAL NOT NULL)"
+                )
+                self.db.commit()
+            except sqlite3.Error as e:
+                print(f"[Cache] disk tier disabled: {e}")
+                self.db = None
+                self.path = None
+        return self.db
+
+    @staticmethod
+    def _answers(entry, depth, time_limit):
+        move, score, done_depth, max_depth, budget = entry
+        # Deeper cached result answers a shallower request
+        if done_depth >= depth:
+            return True
+        # Search stopped on time: a fresh search with no more time and no
+        # more depth than before would not get any further
+        return time_limit <= budget and depth <= max_depth
+
+    def _remember(self, key, entry):
+        self.lru[key] = entry
+        self.lru.move_to_end(key)
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def _read(self, key):
+        db = self._connect()
+        if db is None:
+            return None
+        try:
+            return db.execute(
+                "SELECT move, score, depth, max_depth, time_limit FROM analysis WHERE key = ?",
+                (key,),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[Cache] read failed: {e}")
+            return None
+
+    def get(self, board: chess.Board, depth, time_limit):
+        """Return (move, score, depth) if a good enough result is cached, else None."""
+        key = position_hash(board)
+        with self.lock:
+            entry = self.lru.get(key)
+            if entry is not None:
+                self.lru.move_to_end(key)
+            if entry is None or not self._answers(entry, depth, time_limit):
+                # Not in memory, or too shallow: another worker may have written a deeper row
+                row = self._read(key)
+                if row and (entry is None or row[2] >= entry[2]):
+                    entry = row
+                    self._remember(key, entry)
+
+            if entry is None or not self._answers(entry, depth, time_limit):
+                self.misses += 1
+                return None
+
+            move = chess.Move.from_uci(entry[0])
+            if move not in board.legal_moves:
+                # Hash collision, never trust it
+                self.misses += 1
+                return None
+            self.hits += 1
+            return move, entry[1], entry[2]
+
+    def put(self, board: chess.Board, move, score, depth, max_depth, time_limit):
+        if move is None or depth <= 0:
+            return
+        key = position_hash(board)
+        entry = (move.uci(), score, depth, max_depth, time_limit)
+        with self.lock:
+            old = self.lru.get(key)
+            if old is not None and old[2] > depth:
+                return
+            self._remember(key, entry)
+
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                # Only overwrite a shallower row (or the same depth with a bigger budget)
+                db.execute(
+                    "INSERT INTO analysis (key, move, score, depth, max_depth, time_limit, created)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(key) DO UPDATE SET"
+                    " move = excluded.move, score = excluded.score, depth = excluded.depth,"
+                    " max_depth = excluded.max_depth, time_limit = excluded.time_limit,"
+                    " created = excluded.created"
+                    " WHERE excluded.depth > analysis.depth"
+                    " OR (excluded.depth = analysis.depth AND excluded.time_limit >= analysis.time_limit)",
+                    (key, move.uci(), score, depth, max_depth, time_limit, time.time()),
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"[Cache] write failed: {e}")
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        with self.lock:
+            self.lru.clear()
+            db = self._connect()
+            if db is not None:
+                db.execute("DELETE FROM analysis")
+                db.commit()
+
+
+ANALYSIS_CACHE = AnalysisCache()
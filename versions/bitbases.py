@@ -0,0 +1,416 @@
+"""
+Win/draw/loss endgame bitbases for 3 and 4 piece positions.
+
+Offline:  python -m versions.bitbases KQvK KRvK KPvK KBNvK KRvKP
+Runtime:  probe(board) -> WIN / DRAW / LOSS for the side to move, or None
+
+Tables are built by retrograde analysis (mates first, then walk the
+predecessor graph backwards) and stored as 2 bits per position in
+bitbases/<signature>.bb, which is memory-mapped on first probe.
+"""
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+import chess
+
+BITBASE_DIR = os.environ.get("HALFMIND_BITBASE_DIR", "bitbases")
+MAX_PIECES = 4
+
+DRAW = 0
+WIN = 1
+LOSS = 2
+
+HEADER = struct.Struct("<4sB11s")
+MAGIC = b"HMBB"
+VERSION = 1
+
+# Order pieces inside a signature (and inside the index): strongest first
+PIECE_ORDER = [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT, chess.PAWN]
+PIECE_WEIGHT = {chess.QUEEN: 9, chess.ROOK: 5, chess.BISHOP: 3, chess.KNIGHT: 3, chess.PAWN: 1}
+SYMBOLS = {chess.QUEEN: "Q", chess.ROOK: "R", chess.BISHOP: "B", chess.KNIGHT: "N", chess.PAWN: "P"}
+
+
+# --- SYMMETRY ---
+# Pawnless: 8 symmetries, white king folded into the a1-d1-d4 triangle (10 squares)
+# With pawns: only the left/right mirror, white king on files a-d (32 squares)
+
+def _flip_file(sq): return sq ^ 7
+def _flip_rank(sq): return sq ^ 56
+def _flip_diag(sq): return ((sq & 7) << 3) | (sq >> 3)
+
+
+def _build_transforms(has_pawns):
+    transforms = []
+    for ksq in range(64):
+        funcs = []
+        f, r = chess.square_file(ksq), chess.square_rank(ksq)
+        if f > 3:
+            funcs.append(_flip_file)
+            f = 7 - f
+        if not has_pawns:
+            if r > 3:
+                funcs.append(_flip_rank)
+                r = 7 - r
+            if r > f:
+                funcs.append(_flip_diag)
+        mapping = list(range(64))
+        for fn in funcs:
+            mapping = [fn(s) for s in mapping]
+        transforms.append(mapping)
+    return transforms
+
+
+TRANSFORMS = {False: _build_transforms(False), True: _build_transforms(True)}
+KING_SQUARES = {
+    False: [sq for sq in range(64) if chess.square_file(sq) <= 3 and chess.square_rank(sq) <= chess.square_file(sq)],
+    True: [sq for sq in range(64) if chess.square_file(sq) <= 3],
+}
+KING_INDEX = {hp: {sq: i for i, sq in enumerate(squares)} for hp, squares in KING_SQUARES.items()}
+
+
+# --- SIGNATURES ---
+
+def _side_string(types):
+    return "K" + "".join(SYMBOLS[t] for t in sorted(types, key=PIECE_ORDER.index))
+
+
+def _side_weight(types):
+    return sum(PIECE_WEIGHT[t] for t in types)
+
+
+def signature_of(white_types, black_types):
+    """Canonical signature and whether colours have to be swapped to match it."""
+    w, b = _side_string(white_types), _side_string(black_types)
+    swap = (_side_weight(black_types), b) > (_side_weight(white_types), w)
+    return (b + "v" + w, True) if swap else (w + "v" + b, False)
+
+
+def parse_signature(sig):
+    """'KRvKP' -> [(KING, WHITE), (ROOK, WHITE), (KING, BLACK), (PAWN, BLACK)]"""
+    white, black = sig.upper().split("V")
+    pieces = []
+    for color, side in ((chess.WHITE, white), (chess.BLACK, black)):
+        for ch in side:
+            pieces.append((chess.Piece.from_symbol(ch).piece_type, color))
+    return pieces
+
+
+class Table:
+    def __init__(self, sig):
+        self.sig = sig
+        self.pieces = parse_signature(sig)
+        self.has_pawns = any(t == chess.PAWN for t, _ in self.pieces)
+        self.transforms = TRANSFORMS[self.has_pawns]
+        self.king_index = KING_INDEX[self.has_pawns]
+        self.n_kings = len(KING_SQUARES[self.has_pawns])
+        self.size = 2 * self.n_kings * 64 ** (len(self.pieces) - 1)
+        self.data = None
+
+    def index(self, squares, turn):
+        # squares follow self.pieces order; turn: True = white to move
+        mapping = self.transforms[squares[0]]
+        idx = (0 if turn else 1) * self.n_kings + self.king_index[mapping[squares[0]]]
+        for sq in squares[1:]:
+            idx = idx * 64 + mapping[sq]
+        return idx
+
+    def decode(self, idx):
+        squares = []
+        for _ in range(len(self.pieces) - 1):
+            squares.append(idx & 63)
+            idx >>= 6
+        squares.append(KING_SQUARES[self.has_pawns][idx % self.n_kings])
+        squares.reverse()
+        return squares, idx // self.n_kings == 0
+
+    def value(self, idx):
+        return (self.data[idx >> 2] >> ((idx & 3) * 2)) & 3
+
+    def load(self, path):
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, sig = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION or sig.rstrip(b"\0").decode() != self.sig:
+            raise ValueError(f"{path}: not a {self.sig} bitbase")
+        if len(mm) != HEADER.size + (self.size + 3) // 4:
+            raise ValueError(f"{path}: truncated")
+        self.data = memoryview(mm)[HEADER.size:]
+        return self
+
+    def save(self, path, values):
+        packed = bytearray((self.size + 3) // 4)
+        for idx, v in enumerate(values):
+            if v:
+                packed[idx >> 2] |= v << ((idx & 3) * 2)
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.sig.encode()))
+            f.write(packed)
+
+
+# --- RUNTIME PROBING ---
+
+TABLES = {}          # signature -> loaded Table (or None if no file)
+
+
+def table_for(sig):
+    if sig not in TABLES:
+        path = os.path.join(BITBASE_DIR, sig + ".bb")
+        try:
+            TABLES[sig] = Table(sig).load(path)
+        except (OSError, ValueError):
+            TABLES[sig] = None
+    return TABLES[sig]
+
+
+def load_all(directory=None):
+    """Map every table in the directory up front (used at startup)."""
+    directory = directory or BITBASE_DIR
+    if not os.path.isdir(directory):
+        return 0
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".bb"):
+            table_for(name[:-3])
+    return sum(1 for t in TABLES.values() if t is not None)
+
+
+def _probe_pieces(pieces, turn, lookup):
+    """pieces: list of (piece_type, color, square). Value for the side to move."""
+    white = [t for t, c, _ in pieces if c == chess.WHITE and t != chess.KING]
+    black = [t for t, c, _ in pieces if c == chess.BLACK and t != chess.KING]
+    # Lone minor (or nothing) against a bare king -> dead draw, no table needed
+    if (not white and _no_mating_material(black)) or (not black and _no_mating_material(white)):
+        return DRAW
+
+    sig, swap = signature_of(white, black)
+    table = lookup(sig)
+    if table is None:
+        return None
+
+    if swap:
+        pieces = [(t, not c, sq ^ 56) for t, c, sq in pieces]
+        turn = not turn
+
+    # Arrange squares in table order (identical pieces are interchangeable)
+    remaining = list(pieces)
+    squares = []
+    for ptype, color in table.pieces:
+        for i, (t, c, sq) in enumerate(remaining):
+            if t == ptype and c == color:
+                squares.append(sq)
+                del remaining[i]
+                break
+    return table.value(table.index(squares, turn))
+
+
+def _no_mating_material(types):
+    return not types or (len(types) == 1 and types[0] in (chess.KNIGHT, chess.BISHOP))
+
+
+def probe(board: chess.Board):
+    """WIN / DRAW / LOSS for the side to move, or None if not covered."""
+    occupied = board.occupied
+    if chess.popcount(occupied) > MAX_PIECES or board.castling_rights or board.ep_square is not None:
+        return None
+    pieces = [(p.piece_type, p.color, sq) for sq, p in board.piece_map().items()]
+    return _probe_pieces(pieces, board.turn, table_for)
+
+
+# --- OFFLINE GENERATION ---
+
+BUILT = {}          # tables finished during this run (generation needs sub-tables)
+
+
+def _generation_lookup(sig):
+    if sig in BUILT:
+        return BUILT[sig]
+    table = table_for(sig)
+    if table is None:
+        table = generate(sig)
+    return table
+
+
+class _Values:
+    # Lets a table under construction answer probes from in-memory values
+    def __init__(self, table, values):
+        self.table, self.values = table, values
+
+    def value(self, idx): return self.values[idx]
+    def index(self, squares, turn): return self.table.index(squares, turn)
+
+    @property
+    def pieces(self): return self.table.pieces
+
+
+def _set_board(board, pieces, squares, turn):
+    masks = [0] * 7
+    white = black = 0
+    for (ptype, color), sq in zip(pieces, squares):
+        bb = 1 << sq
+        masks[ptype] |= bb
+        if color:
+            white |= bb
+        else:
+            black |= bb
+    board.pawns, board.knights, board.bishops = masks[1], masks[2], masks[3]
+    board.rooks, board.queens, board.kings = masks[4], masks[5], masks[6]
+    board.occupied_co[chess.WHITE] = white
+    board.occupied_co[chess.BLACK] = black
+    board.occupied = white | black
+    board.promoted = 0
+    board.turn = turn
+
+
+def generate(sig, directory=None, verbose=True):
+    """Build one table (and any missing sub-tables it converts into)."""
+    directory = directory or BITBASE_DIR
+    table = Table(sig)
+    if len(table.pieces) > MAX_PIECES:
+        raise ValueError(f"{sig}: at most {MAX_PIECES} pieces supported")
+    canon, swap = signature_of(
+        [t for t, c in table.pieces if c and t != chess.KING],
+        [t for t, c in table.pieces if not c and t != chess.KING],
+    )
+    if canon != sig:
+        raise ValueError(f"{sig}: use the canonical name {canon}")
+
+    start = time.time()
+    size = table.size
+    pieces = table.pieces
+    n = len(pieces)
+    pawns = [i for i, (t, _) in enumerate(pieces) if t == chess.PAWN]
+    black_king = pieces.index((chess.KING, chess.BLACK))
+
+    values = bytearray(size)          # DRAW / WIN / LOSS
+    resolved = bytearray(size)        # 1 = value final (includes illegal)
+    remaining = bytearray(size)       # in-table successors not yet known to be WIN for the opponent
+    can_draw = bytearray(size)        # some exit leads to a non-losing position
+    succ_start = array("q", [0]) * (size + 1)
+    succ = array("I")
+    queue = array("I")
+
+    board = chess.Board(None)
+    board.castling_rights = 0
+    board.ep_square = None
+    lookup = _generation_lookup
+
+    if verbose:
+        print(f"[{sig}] {size} positions")
+
+    # 1. Forward pass: terminal positions, exits to other tables, successor lists
+    for idx in range(size):
+        succ_start[idx] = len(succ)
+        squares, turn = table.decode(idx)
+        if len(set(squares)) != n or any(squares[i] >> 3 in (0, 7) for i in pawns):
+            resolved[idx] = 1
+            continue
+        _set_board(board, pieces, squares, turn)
+        # Side that just moved may not be left in check
+        their_king = squares[black_king] if turn else squares[0]
+        if board.is_attacked_by(turn, their_king):
+            resolved[idx] = 1
+            continue
+
+        moves = list(board.generate_legal_moves())
+        if not moves:
+            values[idx] = LOSS if board.is_check() else DRAW
+            resolved[idx] = 1
+            if values[idx] == LOSS:
+                queue.append(idx)
+            continue
+
+        win = False
+        count = 0
+        for move in moves:
+            mover = squares.index(move.from_square)
+            new_squares = list(squares)
+            new_squares[mover] = move.to_square
+            if move.to_square in squares or move.promotion:
+                # Capture or promotion: look the result up in the other table
+                new_pieces = [
+                    (move.promotion if i == mover and move.promotion else t, c, s)
+                    for i, ((t, c), s) in enumerate(zip(pieces, new_squares))
+                    if not (s == move.to_square and i != mover)
+                ]
+                v = _probe_pieces(new_pieces, not turn, lookup)
+                if v is None:
+                    raise RuntimeError(f"{sig}: sub-table for {new_pieces} unavailable")
+                if v == LOSS:
+                    win = True
+                    break
+                if v == DRAW:
+                    can_draw[idx] = 1
+            else:
+                succ.append(table.index(new_squares, not turn))
+                count += 1
+
+        if win:
+            values[idx] = WIN
+            resolved[idx] = 1
+            queue.append(idx)
+            del succ[succ_start[idx]:]
+        elif count == 0:
+            # Every move leaves the table
+            values[idx] = DRAW if can_draw[idx] else LOSS
+            resolved[idx] = 1
+            if values[idx] == LOSS:
+                queue.append(idx)
+        else:
+            remaining[idx] = count
+    succ_start[size] = len(succ)
+
+    # 2. Reverse the successor graph (counting sort)
+    pred_start = array("q", [0]) * (size + 1)
+    for dst in succ:
+        pred_start[dst + 1] += 1
+    for i in range(size):
+        pred_start[i + 1] += pred_start[i]
+    pred = array("I", bytes(4 * len(succ)))
+    fill = array("q", pred_start)
+    for src in range(size):
+        for k in range(succ_start[src], succ_start[src + 1]):
+            dst = succ[k]
+            pred[fill[dst]] = src
+            fill[dst] += 1
+    del succ, succ_start, fill
+
+    # 3. Retrograde propagation
+    head = 0
+    while head < len(queue):
+        idx = queue[head]
+        head += 1
+        v = values[idx]
+        for k in range(pred_start[idx], pred_start[idx + 1]):
+            p = pred[k]
+            if resolved[p]:
+                continue
+            if v == LOSS:
+                values[p] = WIN
+                resolved[p] = 1
+                queue.append(p)
+            else:
+                remaining[p] -= 1
+                if remaining[p] == 0 and not can_draw[p]:
+                    values[p] = LOSS
+                    resolved[p] = 1
+                    queue.append(p)
+
+    # Whatever is still open can be held forever -> DRAW (already 0)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, sig + ".bb")
+    table.save(path, values)
+    BUILT[sig] = _Values(table, values)
+    if verbose:
+        wins = values.count(WIN)
+        losses = values.count(LOSS)
+        print(f"[{sig}] done in {time.time() - start:.1f}s: {wins} wins, {losses} losses -> {path}")
+    return BUILT[sig]
+
+
+if __name__ == "__main__":
+    sigs = sys.argv[1:] or ["KQvK", "KRvK", "KPvK"]
+    for s in sigs:
+        generate(s)
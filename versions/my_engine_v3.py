@@ -1,7 +1,13 @@
 import chess
+import chess.polyglot
 import math
+import os
 import random
 import time
+from collections import OrderedDict
+
+from versions.analysis_cache import ANALYSIS_CACHE
+from versions.bitbases import probe as probe_bitbase, MAX_PIECES as BITBASE_PIECES, WIN, DRAW
 
 CHECK_BONUS = 50000          # Logic #4: Checks are top priority
 PROMOTION_BONUS = 30000      # Logic #5: Promotions are massive
@@ -10,8 +16,42 @@ KILLER_1_BONUS = 9000        # Logic #7: Killers above quiet moves
 KILLER_2_BONUS = 8000
 BAD_CAPTURE_PENALTY = 25000 
 PASSED_PAWN_BONUS = 50  # Logic #6: Enough to sink bad captures below zer
+BITBASE_WIN = 5000      # Known win: below mate scores (9999) but above any normal eval
+
+# Frontier pruning (depth 1-3). Each one can be switched off to measure it (bench.py).
+PRUNING = {
+    'reverse_futility': True,   # static eval far above beta -> cut without searching
+    'razoring': True,           # static eval far below alpha -> drop into quiescence
+    'futility': True,           # quiet moves can't lift static eval up to alpha -> skip them
+    'late_move': True,          # only the first few quiet moves at low depth
+    'lmr': True,                # late move reductions
+}
+REVERSE_FUTILITY_MARGIN = 120         # per ply of depth
+RAZOR_MARGIN = [0, 300, 500]          # by depth
+FUTILITY_MARGIN = [0, 200, 350, 500]  # by depth
+LATE_MOVE_COUNT = [0, 8, 12, 18]      # quiet moves searched before the rest are pruned, by depth
 TT = {}  #Tranpostions
+TT_MAX_ENTRIES = 100000   # TT is cleared between searches once it grows past this
 killers={}
+NODES = 0      # nodes searched by the current search (minimax + quiescence)
+LAST_SEARCH = {}   # summary of the last get_best_move_iterative call (read by metrics)
+
+# Last completed iteration per position (LRU), so asking again continues at the next depth
+RESUME_SIZE = 4096
+RESUME = OrderedDict()   # transposition key -> {'depth', 'score', 'move', 'pv'}
+HISTORY = []   # position hashes: game history since the last irreversible move + current search path
+
+# Static eval cache: direct-mapped, one slot per (hash & mask), the full hash
+# is kept next to the score to verify the slot really holds this position
+EVAL_CACHE_SIZE = 1 << 18
+EVAL_CACHE_MASK = EVAL_CACHE_SIZE - 1
+eval_cache_keys = [None] * EVAL_CACHE_SIZE
+eval_cache_scores = [0] * EVAL_CACHE_SIZE
+EVAL_PROBES = 0
+EVAL_HITS = 0
+STOP = None    # threading.Event of the current search; set it to abort
+NODE_LIMIT = None   # node budget of the current search (armed once depth 1 has finished)
+RANDOM_MULTIPV = 4  # root moves considered when picking randomly among near-best moves
 
 PIECE_VALUES = {
     chess.PAWN: 100,
@@ -95,27 +135,70 @@ king_endgame_table = [
     -50, -30, -30, -30, -30, -30, -30, -50  
 ]
 
+# Attack terms (from attack bitboards)
+MOBILITY_WEIGHTS = {chess.KNIGHT: 4, chess.BISHOP: 4, chess.ROOK: 2, chess.QUEEN: 1}
+MOBILITY_BASE = {chess.KNIGHT: 4, chess.BISHOP: 6, chess.ROOK: 7, chess.QUEEN: 13}  # typical count scores 0
+KING_ATTACK_WEIGHT = 6   # per (attacker, king-zone square) pair; middlegame only
+
+# Squares that must be free of enemy pawns for a pawn to be passed: same and adjacent files, ahead of it
+PASSED_MASKS = {chess.WHITE: [0] * 64, chess.BLACK: [0] * 64}
+for _square in chess.SQUARES:
+    _file, _rank = chess.square_file(_square), chess.square_rank(_square)
+    _files = sum(chess.BB_FILES[max(0, _file - 1): _file + 2])
+    PASSED_MASKS[chess.WHITE][_square] = _files & sum(chess.BB_RANKS[_rank + 1:])
+    PASSED_MASKS[chess.BLACK][_square] = _files & sum(chess.BB_RANKS[:_rank])
+# King and the squares around it
+KING_ZONE = [chess.BB_KING_ATTACKS[sq] | chess.BB_SQUARES[sq] for sq in chess.SQUARES]
+
+# Lazy evaluation: terms are added in cost order (material + pawn structure, PST, attacks).
+# After each tier, if the most the remaining tiers can add or take away, given the pieces on
+# the board, can't bring the score back inside (alpha, beta), the eval stops with that bound.
+# Per piece type: the lowest / highest entry of its PST, and of its attack terms
+PST_TABLES = {
+    is_eg: tuple((piece_type, table, min(table), max(table)) for piece_type, table in (
+        (chess.PAWN, pawntable), (chess.KNIGHT, knightstable), (chess.BISHOP, bishoptable),
+        (chess.ROOK, rooktable), (chess.QUEEN, queentable),
+        (chess.KING, king_endgame_table if is_eg else kingtable)))
+    for is_eg in (False, True)
+}
+
+def _empty_board_attacks(piece_type, square):
+    # Blockers only remove squares, so these bound the real attacks
+    if piece_type == chess.KNIGHT: return chess.BB_KNIGHT_ATTACKS[square]
+    attacks = 0
+    if piece_type in (chess.BISHOP, chess.QUEEN):
+        attacks |= chess.BB_DIAG_ATTACKS[square][0]
+    if piece_type in (chess.ROOK, chess.QUEEN):
+        attacks |= chess.BB_RANK_ATTACKS[square][0] | chess.BB_FILE_ATTACKS[square][0]
+    return attacks
+
+ATTACK_RANGE = {False: {}, True: {}}   # is_eg -> piece type -> (lowest, highest) per piece
+for _piece_type, _weight in MOBILITY_WEIGHTS.items():
+    _attacks = [_empty_board_attacks(_piece_type, sq) for sq in chess.SQUARES]
+    _mobility = max(chess.popcount(a) for a in _attacks)
+    _zone_hits = max(chess.popcount(a & KING_ZONE[k]) for a in _attacks for k in chess.SQUARES)
+    _low = -_weight * MOBILITY_BASE[_piece_type]
+    _high = _weight * (_mobility - MOBILITY_BASE[_piece_type])
+    ATTACK_RANGE[True][_piece_type] = (_low, _high)
+    ATTACK_RANGE[False][_piece_type] = (_low, _high + KING_ATTACK_WEIGHT * _zone_hits)
+
+class SearchAborted(Exception):
+    pass
+
+def check_stop():
+    # Called every 64 nodes: cheap enough to never show up in profiles, fine-grained enough for small node budgets
+    if STOP is not None and STOP.is_set():
+        raise SearchAborted()
+    if NODE_LIMIT is not None and NODES >= NODE_LIMIT:
+        raise SearchAborted()
+
 def is_endgame(board):
     # True if no Queens or very few pieces left
-    queens = len(board.pieces(chess.QUEEN, chess.WHITE)) + len(board.pieces(chess.QUEEN, chess.BLACK))
-    minor_pieces = len(board.piece_map()) <= 12
-    return (queens == 0) or minor_pieces
-    
+    return not board.queens or chess.popcount(board.occupied) <= 12
+
 def is_passed_pawn(board, square, color):
     # Checks if a pawn has no opposing pawns in front of it on the same or adjacent files
-    rank = chess.square_rank(square)
-    file = chess.square_file(square)
-    enemy_pawns = board.pieces(chess.PAWN, not color)
-    
-    # Define the 'front' span based on color
-    start_rank = rank + 1 if color == chess.WHITE else 0
-    end_rank = 7 if color == chess.WHITE else rank - 1
-    
-    for r in range(start_rank, end_rank + 1):
-        for f in range(max(0, file - 1), min(8, file + 2)):
-            if (r * 8 + f) in enemy_pawns:
-                return False
-    return True
+    return not PASSED_MASKS[color][square] & board.pawns & board.occupied_co[not color]
 
 def sort_moves(board: chess.Board, depth=0, killers=None,hash_move=None):
     """
@@ -225,47 +308,144 @@ def sort_moves(board: chess.Board, depth=0, killers=None,hash_move=None):
         moves.insert(0, hash_move)
     return moves
 
-def evaluate_board(board: chess.Board):
-    if board.is_checkmate():
-        return -9999 if board.turn else 9999
-    
-    if board.is_game_over(): 
-        return 0
-    
+def bitbase_score(board: chess.Board):
+    # Exact W/D/L from the bitbases, plus a mop-up term so the winning side
+    # actually makes progress (drive king to the edge, push pawns, win material)
+    result = probe_bitbase(board)
+    if result is None: return None
+    if result == DRAW: return 0
+
+    winner = board.turn if result == WIN else not board.turn
+    winner_king = board.king(winner)
+    loser_king = board.king(not winner)
+    file, rank = chess.square_file(loser_king), chess.square_rank(loser_king)
+    centre_distance = max(3 - file, file - 4) + max(3 - rank, rank - 4)
+
+    score = BITBASE_WIN + 10 * centre_distance + 4 * (7 - chess.square_distance(winner_king, loser_king))
+    for piece in board.piece_map().values():
+        value = PIECE_VALUES[piece.piece_type]
+        score += value if piece.color == winner else -value
+    for square in board.pieces(chess.PAWN, winner):
+        rank = chess.square_rank(square)
+        score += 10 * (rank if winner == chess.WHITE else 7 - rank)
+    return score if winner == chess.WHITE else -score
+
+def evaluate_board(board: chess.Board, position_key=None, alpha=-math.inf, beta=math.inf):
+    # Static evaluation only: mate / stalemate are found by the search when a node
+    # has no legal moves, and draws by repetition / 50 moves through HISTORY.
+    # Given a window, the result may be a bound outside it instead of the exact score (lazy eval).
+    global EVAL_PROBES, EVAL_HITS
+
+    # Depends on the position only -> eval cache
+    h = hash(position_key if position_key is not None else board._transposition_key())
+    slot = h & EVAL_CACHE_MASK
+    EVAL_PROBES += 1
+    if eval_cache_keys[slot] == h:
+        EVAL_HITS += 1
+        return eval_cache_scores[slot]
+
+    score, exact = static_eval(board, alpha, beta)
+    # Bounds are only valid for the window they were computed for
+    if exact:
+        eval_cache_keys[slot] = h
+        eval_cache_scores[slot] = score
+    return score
+
+def eval_cache_hit_rate():
+    return EVAL_HITS / EVAL_PROBES if EVAL_PROBES else 0.0
+
+def reset_eval_cache_stats():
+    global EVAL_PROBES, EVAL_HITS
+    EVAL_PROBES = EVAL_HITS = 0
+
+def static_eval(board: chess.Board, alpha=-math.inf, beta=math.inf):
+    """(score, exact). Not exact: the score is a bound at or beyond the window edge, and so is the real eval."""
+    if chess.popcount(board.occupied) <= BITBASE_PIECES:
+        score = bitbase_score(board)
+        if score is not None: return score, True
+
+    white, black = board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK]
+
+    # 1. Material and pawn structure: popcounts and pawn fills, exact and cheap.
+    # Passed pawns come first because their term isn't bounded (two passers on the 7th = 500)
+    score = 0
+    counts = {}
+    for piece_type in (chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING):
+        pieces = board.pieces_mask(piece_type, chess.WHITE) | board.pieces_mask(piece_type, chess.BLACK)
+        n_white, n_black = chess.popcount(pieces & white), chess.popcount(pieces & black)
+        counts[piece_type] = n_white, n_black
+        score += PIECE_VALUES[piece_type] * (n_white - n_black)
+    white_pawns, black_pawns = board.pawns & white, board.pawns & black
+    for square in chess.scan_forward(white_pawns & ~pawn_front_spans(black_pawns, chess.BLACK)):
+        score += PASSED_PAWN_BONUS * (chess.square_rank(square) - 1)
+    for square in chess.scan_forward(black_pawns & ~pawn_front_spans(white_pawns, chess.WHITE)):
+        score -= PASSED_PAWN_BONUS * (6 - chess.square_rank(square))
+
+    # What the PST and attack tiers can still add (high) or take away (low) with these pieces
     is_eg = is_endgame(board)
-    evaluation = 0
-    for square, piece in board.piece_map().items():
-        
-        # 1. Material Value
-        value = PIECE_VALUES.get(piece.piece_type, 0)
-        # 2. Positional Score (PST)
-        
-        # Determine which table to use
-        if piece.piece_type == chess.PAWN: table = pawntable
-        elif piece.piece_type == chess.KNIGHT: table = knightstable
-        elif piece.piece_type == chess.BISHOP:table = bishoptable
-        elif piece.piece_type == chess.ROOK:table = rooktable
-        elif piece.piece_type == chess.QUEEN: table = queentable
-        elif piece.piece_type == chess.KING: table = table = king_endgame_table if is_eg else kingtable
-        else: table = [0] * 64 # Default to 0 if table missing
-        # Handle mirroring for Black
-        if piece.color == chess.WHITE:
-            if piece.piece_type == chess.PAWN and is_passed_pawn(board, square, chess.WHITE):
-                rank = chess.square_rank(square)
-                evaluation += PASSED_PAWN_BONUS * (rank - 1)
-            evaluation += (table[chess.square_mirror(square)] + value)
-        else:
-            if piece.piece_type == chess.PAWN and is_passed_pawn(board, square, chess.BLACK):
-                rank = chess.square_rank(square)
-                evaluation -= PASSED_PAWN_BONUS * (6 - rank)
-            evaluation -= (table[square] + value)
-        # print(f"Eval: {evaluation} , position score:{position_score} Sqaure: {square} pice: {piece} turn:{board.turn}")
-
-    return evaluation
+    pst_low = pst_high = attack_low = attack_high = 0
+    for piece_type, _, low, high in PST_TABLES[is_eg]:
+        n_white, n_black = counts[piece_type]
+        pst_low += n_white * low - n_black * high
+        pst_high += n_white * high - n_black * low
+    for piece_type, (low, high) in ATTACK_RANGE[is_eg].items():
+        n_white, n_black = counts[piece_type]
+        attack_low += n_white * low - n_black * high
+        attack_high += n_white * high - n_black * low
+    bound = lazy_bound(score, pst_low + attack_low, pst_high + attack_high, alpha, beta)
+    if bound is not None: return bound, False
+
+    # 2. Positional Score (PST). White squares are mirrored (tables are from white's side, a8 first)
+    for piece_type, table, _, _ in PST_TABLES[is_eg]:
+        pieces = board.pieces_mask(piece_type, chess.WHITE) | board.pieces_mask(piece_type, chess.BLACK)
+        for square in chess.scan_forward(pieces & white):
+            score += table[square ^ 56]
+        for square in chess.scan_forward(pieces & black):
+            score -= table[square]
+    bound = lazy_bound(score, attack_low, attack_high, alpha, beta)
+    if bound is not None: return bound, False
+
+    # 3. Attacks: mobility (squares not blocked by own pieces) and pressure on the enemy king zone
+    for color, own, sign in ((chess.WHITE, white, 1), (chess.BLACK, black, -1)):
+        king = board.king(not color)
+        zone = KING_ZONE[king] if king is not None and not is_eg else 0
+        for piece_type, weight in MOBILITY_WEIGHTS.items():
+            base = MOBILITY_BASE[piece_type]
+            for square in chess.scan_forward(board.pieces_mask(piece_type, color)):
+                attacks = board.attacks_mask(square)
+                score += sign * weight * (chess.popcount(attacks & ~own) - base)
+                if attacks & zone:
+                    score += sign * KING_ATTACK_WEIGHT * chess.popcount(attacks & zone)
+    return score, True
+
+def pawn_front_spans(pawns, color):
+    # Squares ahead of `pawns` (towards promotion) on their own and adjacent files:
+    # an enemy pawn outside these is passed
+    if color == chess.WHITE:
+        span = pawns << 8
+        span |= span << 8
+        span |= span << 16
+        span |= span << 32
+    else:
+        span = pawns >> 8
+        span |= span >> 8
+        span |= span >> 16
+        span |= span >> 32
+    span &= chess.BB_ALL
+    return span | (span << 1 & ~chess.BB_FILE_A & chess.BB_ALL) | (span >> 1 & ~chess.BB_FILE_H)
+
+def lazy_bound(score, low, high, alpha, beta):
+    # The remaining terms add between `low` and `high`: outside the window even then -> bound
+    if score + low >= beta: return score + low
+    if score + high <= alpha: return score + high
+    return None
 
 
 def quiescence(board: chess.Board, alpha, beta, maximizing_player, killers, depth=0):
-    
+    global NODES
+    NODES += 1
+    if NODES & 63 == 0: check_stop()
+
     key = (board._transposition_key(), maximizing_player)
     hash_move=None
     if key in TT:
@@ -273,7 +453,11 @@ def quiescence(board: chess.Board, alpha, beta, maximizing_player, killers, dept
         if tt_depth > 0:
             hash_move = tt_move
             
-    stand_pat = evaluate_board(board)
+    # Mated positions must not stand pat; one legal move is enough to rule it out
+    if board.is_check() and not any(board.generate_legal_moves()):
+        return mated_score(board)
+
+    stand_pat = evaluate_board(board, key[0], alpha, beta)
     if depth > 10: return stand_pat
 
     if maximizing_player:
@@ -287,8 +471,10 @@ def quiescence(board: chess.Board, alpha, beta, maximizing_player, killers, dept
     # In quiescence search, we evaluate forcing moves (captures, promotions) 
     # to ensure the static evaluation is on a "quiet" position.
     all_legal_moves = sort_moves(board, depth, killers,hash_move)
+    # Move generation doubles as terminal detection: no moves = mate or stalemate
+    if not all_legal_moves:
+        return mated_score(board) if board.is_check() else 0
     legal_moves=[m for m in all_legal_moves if board.is_capture(m) or m.promotion]
-    # legal_moves=[m for m in all_legal_moves if board.is_capture(m)]
     for move in legal_moves:
         board.push(move)
         score = quiescence(board, alpha, beta, not maximizing_player, killers, depth + 1)
@@ -303,12 +489,43 @@ def quiescence(board: chess.Board, alpha, beta, maximizing_player, killers, dept
 
     return alpha if maximizing_player else beta
 
+def mated_score(board: chess.Board):
+    # Side to move has no legal moves and is in check
+    return -9999 if board.turn else 9999
+
+def is_repetition(h, halfmove_clock):
+    # Same side to move -> every second entry; nothing before the last irreversible move can repeat
+    n = len(HISTORY)
+    for i in range(2, min(halfmove_clock, n) + 1, 2):
+        if HISTORY[n - i] == h:
+            return True
+    return False
+
+def position_history(board: chess.Board):
+    # Hashes of the game positions that can still repeat, oldest first, current position last
+    board = board.copy()
+    hashes = [hash(board._transposition_key())]
+    for _ in range(min(board.halfmove_clock, len(board.move_stack))):
+        board.pop()
+        hashes.append(hash(board._transposition_key()))
+    hashes.reverse()
+    return hashes
+
 def minimax(board: chess.Board, depth, alpha, beta, maximizing_player):
+    global NODES
+    NODES += 1
+    if NODES & 63 == 0: check_stop()
+
     alpha_orig = alpha
     beta_orig = beta
     key = (board._transposition_key(), maximizing_player)
     hash_move=None
 
+    # Draws: 50-move rule, repetition of a game / search position
+    h = hash(key[0])
+    if board.halfmove_clock >= 100 or is_repetition(h, board.halfmove_clock):
+        return 0
+
     # TT READ
     if key in TT:
         tt_value, tt_move, tt_depth, tt_flag = TT[key]
@@ -319,10 +536,42 @@ def minimax(board: chess.Board, depth, alpha, beta, maximizing_player):
             elif tt_flag == "UPPERBOUND": beta = min(beta, tt_value)
             if alpha >= beta: return tt_value
     
+    # Just converted into a bitbase ending (capture / pawn move): result is known
+    if board.halfmove_clock == 0 and chess.popcount(board.occupied) <= BITBASE_PIECES:
+        score = bitbase_score(board)
+        if score is not None: return score
+
     if depth == 0: return quiescence(board, alpha, beta, maximizing_player,killers=killers)
-    if board.is_game_over(): return evaluate_board(board)
-    
-    if depth >= 3 and not board.is_check() and not is_endgame(board):
+
+    HISTORY.append(h)
+
+    # --- FRONTIER PRUNING ---
+    in_check = board.is_check()
+    static = evaluate_board(board, key[0]) if depth <= 3 and not in_check else None
+
+    if static is not None and PRUNING['reverse_futility']:
+        margin = REVERSE_FUTILITY_MARGIN * depth
+        if maximizing_player and static - margin >= beta:
+            HISTORY.pop()
+            return beta
+        if not maximizing_player and static + margin <= alpha:
+            HISTORY.pop()
+            return alpha
+
+    if static is not None and PRUNING['razoring'] and depth <= 2:
+        margin = RAZOR_MARGIN[depth]
+        if maximizing_player and static + margin <= alpha:
+            v = quiescence(board, alpha, beta, maximizing_player, killers)
+            if v <= alpha:
+                HISTORY.pop()
+                return v
+        elif not maximizing_player and static - margin >= beta:
+            v = quiescence(board, alpha, beta, maximizing_player, killers)
+            if v >= beta:
+                HISTORY.pop()
+                return v
+
+    if depth >= 3 and not in_check and not is_endgame(board):
         board.push(chess.Move.null())
         score = minimax(board, depth - 1 - 2, alpha, beta, not maximizing_player)
         board.pop()
@@ -330,30 +579,53 @@ def minimax(board: chess.Board, depth, alpha, beta, maximizing_player):
         if score >= beta:
         # verify with reduced-depth normal search
             v = minimax(board, depth - 1, alpha, beta, maximizing_player)
+            HISTORY.pop()
             if v < beta: return v
             return beta
     # Pass hash_move to sorter
     legal = sort_moves(board, depth, killers,hash_move)
 
+    # No legal moves: mate or stalemate (found here instead of in evaluate_board)
+    if not legal:
+        HISTORY.pop()
+        return mated_score(board) if board.is_check() else 0
+
     best_val = -math.inf if maximizing_player else math.inf
     best_move_this_node = None # Track the move!
 
-    for i, move in enumerate(legal):
-        board.push(move)
-
-        # --- LMR LOGIC ---
-        new_depth = depth - 1
+    # Futility: even a big positional gain can't bring a quiet move back into the window
+    futile = static is not None and PRUNING['futility'] and (
+        static + FUTILITY_MARGIN[depth] <= alpha if maximizing_player
+        else static - FUTILITY_MARGIN[depth] >= beta
+    )
+    quiet_moves = 0
 
+    for i, move in enumerate(legal):
+        # Must be decided before the move is pushed
         is_quiet = (
             not board.is_capture(move)
             and not move.promotion
             and not board.gives_check(move)
         )
 
+        if is_quiet and best_move_this_node is not None:
+            if futile:
+                continue
+            if static is not None and PRUNING['late_move'] and quiet_moves >= LATE_MOVE_COUNT[depth]:
+                continue
+        if is_quiet:
+            quiet_moves += 1
+
+        board.push(move)
+
+        # --- LMR LOGIC ---
+        new_depth = depth - 1
+
         is_killer = depth in killers and move in killers[depth]
 
         if (
-            i >= 4                  # late move
+            PRUNING['lmr']
+            and i >= 4              # late move
             and depth >= 3          # enough depth
             and is_quiet
             and not is_killer
@@ -366,6 +638,9 @@ def minimax(board: chess.Board, depth, alpha, beta, maximizing_player):
             new_depth -= reduction
 
         eval = minimax(board, new_depth, alpha, beta, not maximizing_player)
+        # Reduced move looks better than expected -> verify at full depth
+        if new_depth < depth - 1 and (eval > alpha if maximizing_player else eval < beta):
+            eval = minimax(board, depth - 1, alpha, beta, not maximizing_player)
         board.pop()
 
         if maximizing_player:
@@ -395,6 +670,8 @@ def minimax(board: chess.Board, depth, alpha, beta, maximizing_player):
                         killers[depth] = killers[depth][:2]
                 break
 
+    HISTORY.pop()
+
     # TT WRITE (Include best_move)
     flag = "EXACT"
     if best_val <= alpha_orig: flag = "UPPERBOUND"
@@ -403,20 +680,16 @@ def minimax(board: chess.Board, depth, alpha, beta, maximizing_player):
     TT[key] = (best_val, best_move_this_node, depth, flag)
     return best_val
 
-def get_best_move_v3(board: chess.Board, depth, alpha, beta, hash_move=None):
-    # Opening book
-    if board.fullmove_number <= 15:
-        move = book_move(board)
-        if move:
-            print(f"[Book] Played {move}")
-            return 0, move
-
+def get_best_move_v3(board: chess.Board, depth, alpha, beta, hash_move=None, excluded=None):
     is_white = board.turn
     best_move = None
     best_eval = -math.inf if is_white else math.inf
 
     # Root move ordering
     legal_moves = list(sort_moves(board, depth, killers, hash_move))
+    if excluded:
+        # Multi-PV: moves already reported as better lines are skipped
+        legal_moves = [m for m in legal_moves if m not in excluded]
     if not legal_moves:
         return 0, None
 
@@ -451,85 +724,299 @@ def get_best_move_v3(board: chess.Board, depth, alpha, beta, hash_move=None):
 
     return best_eval, best_move
 
-def get_best_move_iterative(board: chess.Board,depth, time_limit=math.inf ):
+def resume_point(board: chess.Board):
+    key = board._transposition_key()
+    entry = RESUME.get(key)
+    if entry is None or entry['move'] not in board.legal_moves:
+        return None
+    RESUME.move_to_end(key)
+    return entry
+
+def remember_iteration(board: chess.Board, depth, score, move):
+    key = board._transposition_key()
+    RESUME[key] = {'depth': depth, 'score': score, 'move': move, 'pv': get_pv(board, move, depth)}
+    RESUME.move_to_end(key)
+    if len(RESUME) > RESUME_SIZE:
+        RESUME.popitem(last=False)
+
+def seed_pv(board: chess.Board, pv):
+    # Put a stored PV back into the TT (it may have been cleared since) as move-ordering
+    # hints only: depth -1 never answers a probe
+    board = board.copy(stack=False)
+    for move in pv:
+        key = (board._transposition_key(), board.turn)
+        if key not in TT:
+            TT[key] = (0, move, -1, "EXACT")
+        board.push(move)
+
+def pick_near_best(board: chess.Board, lines, margin):
+    # Uniform choice among the lines within `margin` of the best, from the side to move's view
+    if not lines:
+        return None
+    sign = 1 if board.turn else -1
+    best = lines[0]['score'] * sign
+    return random.choice([line['move'] for line in lines if best - line['score'] * sign <= margin])
+
+def get_pv(board: chess.Board, move, max_len=20):
+    # Follow the TT best moves from the position after `move`
+    pv = [move]
+    board = board.copy()
+    board.push(move)
+    seen = {board._transposition_key()}
+    while len(pv) < max_len:
+        entry = TT.get((board._transposition_key(), board.turn))
+        if not entry or entry[1] is None or entry[1] not in board.legal_moves:
+            break
+        board.push(entry[1])
+        key = board._transposition_key()
+        pv.append(entry[1])
+        if key in seen: break   # repetition, the line loops forever
+        seen.add(key)
+    return pv
+
+def search_multipv(board: chess.Board, depth, time_limit=math.inf, multipv=3, stop=None, nodes=None):
+    """
+    Top `multipv` root moves in one iterative search.
+    Each line re-searches the root with the better lines excluded; all of them share the TT,
+    so later lines (and the next depth) are cheap.
+    Returns a list of {'move', 'score', 'pv', 'depth'}, best first.
+    """
+    global TT, killers, STOP, NODES, NODE_LIMIT
+    if len(TT)>TT_MAX_ENTRIES :TT.clear()
+
+    lines = []
+    start_time = time.time()
+    root_len = len(board.move_stack)
+    STOP = stop
+    NODES = 0
+    HISTORY[:] = position_history(board)
+    reset_eval_cache_stats()
+    # Node-limited: search on a private, empty TT (see get_best_move_iterative)
+    shared_tt = TT
+    if nodes is not None: TT = {}
+    try:
+        try:
+            search_multipv_iterations(board, depth, time_limit, multipv, lines, start_time, nodes)
+        except SearchAborted:
+            while len(board.move_stack) > root_len: board.pop()
+            print("search aborted")
+        # PVs come from this search's TT
+        for line in lines:
+            line['pv'] = get_pv(board, line['move'], line['depth'])
+    finally:
+        STOP = None
+        NODE_LIMIT = None
+        TT = shared_tt
+    LAST_SEARCH.clear()
+    LAST_SEARCH.update(source='search', depth=max((l['depth'] for l in lines), default=0), nodes=NODES)
+    return lines
+
+def search_multipv_iterations(board, depth, time_limit, multipv, lines, start_time, nodes=None):
+    # Fills `lines` in place so an aborted search still keeps its last finished depth
+    global NODE_LIMIT
+    for current_depth in range(1, depth + 1):
+        killers.clear()
+        # Last iteration's order is the best guess for this one
+        order = [line['move'] for line in lines]
+        new_lines = []
+        excluded = []
+        for k in range(multipv):
+            if time.time() - start_time > time_limit:
+                break
+            hash_move = order[k] if k < len(order) else None
+            score, move = get_best_move_v3(board, current_depth, -math.inf, math.inf, hash_move, excluded)
+            if move is None:
+                break
+            excluded.append(move)
+            new_lines.append({'move': move, 'score': score, 'depth': current_depth})
+
+        # Only a finished iteration replaces the previous one
+        if len(new_lines) < min(multipv, board.legal_moves.count()):
+            break
+        lines[:] = new_lines
+        NODE_LIMIT = nodes
+        print(f"Info: Depth {current_depth} multipv " + " ".join(f"{l['move']}:{l['score']}" for l in lines)
+              + f" nodes {NODES} eval cache {eval_cache_hit_rate():.0%}")
+
+        if time.time() - start_time > time_limit:
+            break
+
+def get_best_move_iterative(board: chess.Board,depth, time_limit=math.inf, use_cache=True, multipv=None, stop=None,
+                            nodes=None, margin=0):
+    """
+    Best move for `board` (a list of lines when `multipv` is given).
+    `stop` is an optional threading.Event: once set, the search stops within ~64 nodes
+    and the result of the last finished iteration is returned.
+    `nodes` caps the search at that many nodes (depth 1 always finishes), so the result
+    doesn't depend on machine speed. With `margin` > 0 the move is picked at random among
+    root moves scoring within `margin` centipawns of the best.
+    """
     print("time limit",time_limit)
     print("depth",depth)
     # return get_best_move_v3(board, depth, hash_move=None)[1]
-    global TT, killers
+    global TT, killers, STOP, NODES, NODE_LIMIT
+
+    # Multi-PV: list of lines instead of a single move (no book, no cache)
+    if multipv:
+        return search_multipv(board, depth, time_limit, multipv, stop, nodes)
+
+    # Opening book (checked once, before the cache, so book variety is kept)
+    if board.fullmove_number <= 15:
+        move = book_move(board)
+        if move:
+            print(f"[Book] Played {move}")
+            LAST_SEARCH.clear()
+            LAST_SEARCH.update(source='book', depth=0, nodes=0)
+            return move
+
+    # Weakened play: random pick among the near-best root moves (no cache, it stores only the best)
+    if margin > 0:
+        return pick_near_best(board, search_multipv(board, depth, time_limit, RANDOM_MULTIPV, stop, nodes), margin)
+
+    # Analysis cache: same position already searched at least this deep
+    # (not for node-limited searches: a deeper cached result would play stronger than asked)
+    if use_cache and nodes is None:
+        cached = ANALYSIS_CACHE.get(board, depth, time_limit)
+        if cached:
+            move, score, cached_depth = cached
+            print(f"[Cache] Hit {move} depth {cached_depth} score {score}")
+            LAST_SEARCH.clear()
+            LAST_SEARCH.update(source='cache', depth=cached_depth, nodes=0)
+            return move
 
     # Reset ONCE per move
-    if len(TT)>100000 :TT.clear()
+    if len(TT)>TT_MAX_ENTRIES :TT.clear()
 
     best_move = None
     best_score = None
+    completed_depth = 0
 
     start_time = time.time()
     current_depth = 1
 
-    while True:
-        killers.clear()
-        elapsed_time=time.time()
-        if elapsed_time - start_time > time_limit:
-            break
-
-        window = 50
-
-        if best_score is None:
-            alpha = -math.inf
-            beta = math.inf
-        else:
-            alpha = best_score - window
-            beta = best_score + window
+    # Searched here before (undo, retry with more time): continue after the deepest finished
+    # iteration, with its move first and the aspiration window around its score.
+    # Node-limited searches always start over (no resume, empty TT), so a level plays the same every time.
+    resume = resume_point(board) if use_cache and nodes is None else None
+    if resume:
+        if resume['depth'] >= depth or abs(resume['score']) > 9000:
+            print(f"[Resume] Done {resume['move']} depth {resume['depth']} score {resume['score']}")
+            LAST_SEARCH.clear()
+            LAST_SEARCH.update(source='resume', depth=resume['depth'], nodes=0)
+            return resume['move']
+        best_move, best_score, completed_depth = resume['move'], resume['score'], resume['depth']
+        current_depth = completed_depth + 1
+        seed_pv(board, resume['pv'])
+        print(f"[Resume] From depth {completed_depth} best {best_move} score {best_score}")
+
+    root_len = len(board.move_stack)
+    STOP = stop
+    NODES = 0
+    HISTORY[:] = position_history(board)
+    reset_eval_cache_stats()
+    aborted = False
+    # Node-limited searches run on a private, empty TT: entries left by earlier searches (any game
+    # in this worker) would reach deeper on the same budget. The shared TT is put back untouched.
+    shared_tt = TT
+    if nodes is not None: TT = {}
+    try:
+        while True:
+            killers.clear()
+            elapsed_time=time.time()
+            if elapsed_time - start_time > time_limit:
+                break
 
-        score, move = get_best_move_v3(board, current_depth, alpha, beta, best_move)
+            window = 50
 
-        # fail-low
-        if score <= alpha:
-            score, move = get_best_move_v3(board, current_depth, -math.inf, beta, best_move)
+            if best_score is None:
+                alpha = -math.inf
+                beta = math.inf
+            else:
+                alpha = best_score - window
+                beta = best_score + window
 
-        # fail-high
-        elif score >= beta:
-            score, move = get_best_move_v3(board, current_depth, alpha, math.inf, best_move)
+            score, move = get_best_move_v3(board, current_depth, alpha, beta, best_move)
 
-        if move is None:
-            break
+            # fail-low
+            if score <= alpha:
+                score, move = get_best_move_v3(board, current_depth, -math.inf, beta, best_move)
 
-        if (
-            best_score is not None
-            and move == best_move
-            and ((abs(score) - abs(best_score)) < 20)
-            and current_depth >= 10
-        ):
-            print("break due to similar score")
-            break
-        best_move = move
-        best_score = score
+            # fail-high
+            elif score >= beta:
+                score, move = get_best_move_v3(board, current_depth, alpha, math.inf, best_move)
 
-        # Stop on mate
-        if abs(score) > 9000:
-            break
+            if move is None:
+                break
 
-        print(f"Info: Depth {current_depth} score {score} best {move}")
-        current_depth += 1
-        if current_depth > depth:
-            print("break due to max depth")
-            break
+            if (
+                best_score is not None
+                and move == best_move
+                and ((abs(score) - abs(best_score)) < 20)
+                and current_depth >= 10
+            ):
+                print("break due to similar score")
+                break
+            best_move = move
+            best_score = score
+            completed_depth = current_depth
+            NODE_LIMIT = nodes
+            if use_cache:
+                remember_iteration(board, current_depth, score, move)
+
+            # Stop on mate
+            if abs(score) > 9000:
+                break
 
+            print(f"Info: Depth {current_depth} score {score} best {move} nodes {NODES} eval cache {eval_cache_hit_rate():.0%}")
+            current_depth += 1
+            if current_depth > depth:
+                print("break due to max depth")
+                break
+    except SearchAborted:
+        # Unwind whatever the interrupted search had pushed
+        while len(board.move_stack) > root_len: board.pop()
+        aborted = not (NODE_LIMIT is not None and NODES >= NODE_LIMIT)
+        print(f"search {'aborted' if aborted else 'out of nodes'} at depth {current_depth}")
+    finally:
+        STOP = None
+        NODE_LIMIT = None
+        TT = shared_tt
+
+    if use_cache and best_move is not None:
+        # A mate score is final, so it answers any depth
+        cache_depth = max(completed_depth, depth) if best_score is not None and abs(best_score) > 9000 else completed_depth
+        # An aborted or node-limited search didn't use its time budget, so it only answers by depth
+        ANALYSIS_CACHE.put(board, best_move, best_score, cache_depth, depth,
+                           0 if aborted or nodes is not None else time_limit)
+
+    LAST_SEARCH.clear()
+    LAST_SEARCH.update(source='search', depth=completed_depth, nodes=NODES, aborted=aborted)
     return best_move
 
-def book_move(board):
-    import chess.polyglot
-    BOOK_PATH="Perfect2021.bin"
-    try:
-        with chess.polyglot.open_reader(BOOK_PATH) as reader:
+# Polyglot books, tried in order (HALFMIND_BOOKS: paths separated by os.pathsep, e.g. "my_rep.bin:Perfect2021.bin")
+BOOK_PATHS = [p for p in os.environ.get("HALFMIND_BOOKS", "Perfect2021.bin").split(os.pathsep) if p]
+BOOK_READERS = None   # opened once (memory-mapped); opened before fork, the pages are shared by all workers
+
+def open_books():
+    global BOOK_READERS
+    if BOOK_READERS is None:
+        BOOK_READERS = []
+        for path in BOOK_PATHS:
+            try:
+                BOOK_READERS.append(chess.polyglot.open_reader(path))
+            except FileNotFoundError as e:
+                print(e)
+    return BOOK_READERS
 
+def book_move(board):
+    # First book that knows the position decides
+    for reader in open_books():
+        try:
             # Weighted random choice (important)
             entry = reader.weighted_choice(board)
-            if not entry:
-                return None
+        except IndexError:
+            continue
+        if entry:
             return entry.move
-    except (FileNotFoundError, IndexError) as e:
-        print(e)
-        pass
 
     return None
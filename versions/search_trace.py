@@ -0,0 +1,285 @@
+"""
+Search-tree trace recorder for offline analysis.
+
+While tracing, minimax / quiescence are swapped for wrappers that write one fixed-size
+record per node to a binary file (buffered, streamed out in chunks). Nothing is
+installed otherwise, so normal searches pay nothing.
+
+    python -m versions.search_trace record "<fen>" --depth 5 --out slow.trace
+    python -m versions.search_trace report slow.trace
+
+    with search_trace.tracing("slow.trace", board):
+        get_best_move_iterative(board, 5, use_cache=False)
+
+Records are written when a node returns (post-order). The report aggregates per ply:
+branching factor, cutoff rate and move index, TT hits, LMR reductions and re-searches.
+"""
+import argparse
+import math
+import struct
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+
+import chess
+
+from versions import my_engine_v3 as engine
+
+MAGIC = b"HMTR"
+VERSION = 2
+HEADER = struct.Struct("<4sBH")     # magic, version, length of the root FEN that follows
+# ply | kind << 7, depth, reduction, flags, children, cutoff index, move, alpha, beta, result (16 bytes)
+RECORD = struct.Struct("<BbbBHHHhhh")
+PLY_MASK = 0x7F
+BUFFER_RECORDS = 1 << 16            # records held in memory before a write
+
+MINIMAX, QUIESCENCE = 0, 1
+
+# flags
+MAXIMIZING = 1
+NULL_MOVE = 2          # reached by the null move
+SAME_POSITION = 4      # re-entry without a move: null-move verification, qsearch at depth 0, razoring
+RE_SEARCH = 8          # same move searched again (LMR re-search at full depth)
+TT_ENTRY = 16          # TT had an entry (move ordering hint at least)
+TT_USABLE = 32         # ... deep enough to answer or narrow the window
+FAIL_HIGH = 64         # result >= beta
+FAIL_LOW = 128         # result <= alpha
+
+NO_CUTOFF = 0xFFFF
+SCORE_LIMIT = 32767
+
+
+def encode_move(move):
+    if move is None:
+        return 0
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(code):
+    return chess.Move(code & 63, (code >> 6) & 63, (code >> 12) or None)
+
+
+def clamp(score):
+    if score == math.inf:
+        return SCORE_LIMIT
+    if score == -math.inf:
+        return -SCORE_LIMIT
+    return max(-SCORE_LIMIT, min(SCORE_LIMIT, int(round(score))))
+
+
+class Frame:
+    __slots__ = ("ply", "depth", "stack_len", "children", "move_children", "last_move", "last_len")
+
+    def __init__(self, ply, depth, stack_len):
+        self.ply = ply
+        self.depth = depth
+        self.stack_len = stack_len
+        self.children = 0
+        self.move_children = 0      # children reached by a real move (not null / re-entry / re-search)
+        self.last_move = None
+        self.last_len = None
+
+
+class TraceWriter:
+    def __init__(self, path, root_fen, buffer_records=BUFFER_RECORDS):
+        self.file = open(path, "wb")
+        fen = root_fen.encode()
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(fen)) + fen)
+        self.buffer = bytearray(RECORD.size * buffer_records)
+        self.offset = 0
+        self.records = 0
+
+    def write(self, *fields):
+        RECORD.pack_into(self.buffer, self.offset, *fields)
+        self.offset += RECORD.size
+        self.records += 1
+        if self.offset == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.file.write(memoryview(self.buffer)[:self.offset])
+        self.offset = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class Tracer:
+    def __init__(self, writer):
+        self.writer = writer
+        self.stack = []
+
+    def wrap(self, fn, kind):
+        def traced(board, *args, **kwargs):
+            if kind == MINIMAX:
+                depth, alpha, beta, maximizing = args[0], args[1], args[2], args[3]
+            else:
+                alpha, beta, maximizing = args[0], args[1], args[2]
+                depth = -(args[4] if len(args) > 4 else kwargs.get("depth", 0))
+            stack_len = len(board.move_stack)
+            move = board.move_stack[-1] if board.move_stack else None
+
+            flags = MAXIMIZING if maximizing else 0
+            reduction = 0
+            parent = self.stack[-1] if self.stack else None
+            if parent is not None:
+                parent.children += 1
+                if stack_len == parent.stack_len:
+                    flags |= SAME_POSITION
+                elif move == chess.Move.null():
+                    flags |= NULL_MOVE
+                elif move == parent.last_move and stack_len == parent.last_len:
+                    flags |= RE_SEARCH
+                else:
+                    parent.move_children += 1
+                    if kind == MINIMAX and parent.depth > 0:
+                        reduction = parent.depth - 1 - depth
+                parent.last_move, parent.last_len = move, stack_len
+
+            entry = engine.TT.get((board._transposition_key(), maximizing))
+            if entry is not None:
+                flags |= TT_ENTRY
+                if entry[2] >= max(depth, 1 if kind == QUIESCENCE else 0):
+                    flags |= TT_USABLE
+
+            frame = Frame(len(self.stack) + 1, depth, stack_len)
+            self.stack.append(frame)
+            try:
+                result = fn(board, *args, **kwargs)
+            finally:
+                self.stack.pop()
+
+            if result >= beta:
+                flags |= FAIL_HIGH
+            elif result <= alpha:
+                flags |= FAIL_LOW
+            # Cutoff: the side to move beat its bound (fail high for max, fail low for min)
+            cutoff = NO_CUTOFF
+            if kind == MINIMAX and frame.move_children and flags & (FAIL_HIGH if maximizing else FAIL_LOW):
+                cutoff = frame.move_children - 1
+            self.writer.write(min(frame.ply, PLY_MASK) | kind << 7, max(-128, min(127, depth)),
+                              max(-128, min(127, reduction)), flags, min(frame.move_children, 0xFFFE),
+                              cutoff, encode_move(move), clamp(alpha), clamp(beta), clamp(result))
+            return result
+        return traced
+
+
+@contextmanager
+def tracing(path, board, buffer_records=BUFFER_RECORDS):
+    """Record every minimax / quiescence node searched inside the block to `path`."""
+    writer = TraceWriter(path, board.fen(), buffer_records)
+    tracer = Tracer(writer)
+    original = engine.minimax, engine.quiescence
+    engine.minimax = tracer.wrap(original[0], MINIMAX)
+    engine.quiescence = tracer.wrap(original[1], QUIESCENCE)
+    try:
+        yield writer
+    finally:
+        engine.minimax, engine.quiescence = original
+        writer.close()
+
+
+# --- READER ---
+
+def read_trace(path, chunk_records=BUFFER_RECORDS):
+    """(root fen, iterator over record tuples: ply, kind, depth, ... as in RECORD)."""
+    f = open(path, "rb")
+    magic, version, fen_len = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        f.close()
+        raise ValueError(f"{path}: not a v{VERSION} search trace")
+    fen = f.read(fen_len).decode()
+
+    def records():
+        with f:
+            while True:
+                data = f.read(RECORD.size * chunk_records)
+                if not data:
+                    break
+                for record in RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]):
+                    yield (record[0] & PLY_MASK, record[0] >> 7) + record[1:]
+    return fen, records()
+
+
+def aggregate(records):
+    """Per-ply statistics (dict ply -> dict)."""
+    stats = defaultdict(lambda: defaultdict(int))
+    for ply, kind, depth, reduction, flags, children, cutoff, move, alpha, beta, result in records:
+        s = stats[ply]
+        if kind == QUIESCENCE:
+            s["qnodes"] += 1
+            continue
+        s["nodes"] += 1
+        if children:
+            s["interior"] += 1
+            s["children"] += children
+        if cutoff != NO_CUTOFF:
+            s["cutoffs"] += 1
+            s["cutoff_index"] += cutoff
+            if cutoff == 0:
+                s["first_move_cutoffs"] += 1
+        if flags & TT_ENTRY:
+            s["tt_entry"] += 1
+        if flags & TT_USABLE:
+            s["tt_usable"] += 1
+        if reduction > 0:
+            s["reduced"] += 1
+            s["reduction"] += reduction
+        if flags & RE_SEARCH:
+            s["re_searches"] += 1
+        if flags & NULL_MOVE:
+            s["null_moves"] += 1
+    return stats
+
+
+def report(path, out=sys.stdout):
+    fen, records = read_trace(path)
+    stats = aggregate(records)
+    out.write(f"root {fen}\n\n")
+    out.write(f"{'ply':>3} {'nodes':>9} {'qnodes':>9} {'branch':>7} {'cut%':>6} {'1st%':>6} {'cut idx':>8}"
+              f" {'tt%':>6} {'tt use%':>8} {'reduced':>8} {'avg red':>8} {'re-srch':>8} {'null':>6}\n")
+    totals = defaultdict(int)
+    for ply in sorted(stats):
+        s = stats[ply]
+        for k, v in s.items():
+            totals[k] += v
+        out.write(_row(str(ply), s))
+    out.write(_row("all", totals))
+
+
+def _row(label, s):
+    def pct(a, b):
+        return 100.0 * s[a] / s[b] if s[b] else 0.0
+    nodes = s["nodes"]
+    return (f"{label:>3} {nodes:>9} {s['qnodes']:>9}"
+            f" {s['children'] / s['interior'] if s['interior'] else 0:>7.2f}"
+            f" {pct('cutoffs', 'nodes'):>6.1f} {pct('first_move_cutoffs', 'cutoffs'):>6.1f}"
+            f" {s['cutoff_index'] / s['cutoffs'] if s['cutoffs'] else 0:>8.2f}"
+            f" {pct('tt_entry', 'nodes'):>6.1f} {pct('tt_usable', 'nodes'):>8.1f}"
+            f" {s['reduced']:>8} {s['reduction'] / s['reduced'] if s['reduced'] else 0:>8.2f}"
+            f" {s['re_searches']:>8} {s['null_moves']:>6}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record / summarise search-tree traces")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="search a position with tracing on")
+    rec.add_argument("fen")
+    rec.add_argument("--depth", type=int, default=4)
+    rec.add_argument("--out", default="search.trace")
+    rep = sub.add_parser("report", help="per-ply statistics of a trace")
+    rep.add_argument("trace")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        board = chess.Board(args.fen)
+        with tracing(args.out, board) as writer:
+            move = engine.get_best_move_iterative(board, args.depth, use_cache=False)
+        print(f"[Trace] {move}: {writer.records} nodes -> {args.out}")
+    else:
+        report(args.trace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Startup work for gunicorn's master process (see gunicorn.conf.py, preload_app).
+
+Everything done here happens once, before the workers fork, so they start warm
+and share the memory copy-on-write: opening books and bitbases (memory-mapped),
+lookup tables, a small warm-up search and, optionally, a TT snapshot.
+
+    python warmup.py snapshot --out tt_snapshot.pkl games.pgn   # precompute TT for common positions
+    python warmup.py measure --workers 2                        # time-to-first-move and RSS per worker
+"""
+import argparse
+import gc
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import chess
+import chess.pgn
+
+from versions import bitbases
+from versions import my_engine_v3 as engine
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TT_SNAPSHOT = os.environ.get("HALFMIND_TT_SNAPSHOT", os.path.join(ROOT, "tt_snapshot.pkl"))
+SNAPSHOT_VERSION = 1
+
+# Out of book, so the warm-up search (and measure) actually searches
+WARMUP_FEN = "r1b2rk1/2q1bppp/p2ppn2/1p6/3BPP2/2N2B2/PPPQ2PP/R4R1K w - - 0 20"
+
+
+def load_snapshot(path):
+    """Fill engine.TT from a snapshot made by `python warmup.py snapshot`. Returns entries loaded."""
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        snapshot = pickle.load(f)
+    # TT keys are python-chess transposition keys: only valid for the version that made them
+    if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("chess") != chess.__version__:
+        print(f"[Warmup] ignoring {path}: made for a different engine / python-chess version")
+        return 0
+    entries = snapshot["tt"]
+    engine.TT.update(entries)
+    return len(entries)
+
+
+def warm(snapshot=TT_SNAPSHOT):
+    start = time.time()
+    books = engine.open_books()
+    tables = bitbases.load_all()
+    # One shallow search runs every code path once (move ordering, qsearch, eval cache)
+    engine.get_best_move_iterative(chess.Board(WARMUP_FEN), 2, use_cache=False)
+    tt = load_snapshot(snapshot)
+    # Keep everything allocated so far out of the collector: a GC pass in a worker
+    # would otherwise write to these objects and un-share their pages
+    gc.collect()
+    gc.freeze()
+    print(f"[Warmup] {len(books)} books mapped, {tables} bitbases, "
+          f"{tt} TT entries, {gc.get_freeze_count()} objects frozen in {time.time() - start:.2f}s")
+
+
+def snapshot_positions(paths, plies):
+    """Unique out-of-book positions from the first `plies` plies of every game."""
+    readers = engine.open_books()
+    seen = set()
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            while True:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+                board = game.board()
+                for ply, move in enumerate(game.mainline_moves()):
+                    if ply >= plies:
+                        break
+                    board.push(move)
+                    key = board._transposition_key()
+                    if key in seen or board.is_game_over():
+                        continue
+                    seen.add(key)
+                    if any(reader.get(board) is not None for reader in readers):
+                        continue
+                    yield board.copy()
+
+
+def build_snapshot(paths, out, plies, depth, max_entries):
+    start = time.time()
+    engine.TT.clear()
+    n = 0
+    for board in snapshot_positions(paths, plies):
+        # get_best_move_iterative clears the TT once it passes TT_MAX_ENTRIES
+        if len(engine.TT) >= max_entries:
+            break
+        engine.get_best_move_iterative(board, depth, use_cache=False)
+        n += 1
+    tt = dict(list(engine.TT.items())[:max_entries])
+    with open(out, "wb") as f:
+        pickle.dump({"version": SNAPSHOT_VERSION, "chess": chess.__version__, "tt": tt}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"[Warmup] {n} positions, {len(tt)} TT entries -> {out} in {time.time() - start:.1f}s")
+
+
+# --- MEASURE ---
+
+def memory(pid):
+    # kB from /proc/<pid>/smaps_rollup (Linux): Rss counts shared pages, Pss splits them
+    out = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"):
+                out[name.lower() + "_mb"] = round(int(value.split()[0]) / 1024, 1)
+    return out
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def measure(preload, workers, depth, snapshot):
+    from loadtest import free_port, stop_server
+
+    # No analysis cache, and private metrics (removed afterwards) so the measurement
+    # doesn't show up in the counters a real server on this host exports
+    metrics_dir = tempfile.TemporaryDirectory(prefix="halfmind-measure-")
+    env = dict(os.environ, HALFMIND_PRELOAD="1" if preload else "0", HALFMIND_CACHE_PATH="",
+               HALFMIND_TT_SNAPSHOT=snapshot or "", HALFMIND_METRICS_DIR=metrics_dir.name)
+    port = free_port()
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers),
+                             "-b", f"127.0.0.1:{port}", "app:app"],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    payload = json.dumps({"fen": WARMUP_FEN, "depth": depth, "time_limit": 60}).encode()
+    try:
+        while True:
+            if time.time() - start > 120 or proc.poll() is not None:
+                raise SystemExit("server did not answer")
+            req = urllib.request.Request(f"http://127.0.0.1:{port}/move", data=payload,
+                                         headers={"Content-Type": "application/json"})
+            sent = time.time()
+            try:
+                json.loads(urllib.request.urlopen(req, timeout=120).read())
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.05)
+        done = time.time()
+        time.sleep(0.5)
+        worker_memory = {str(pid): memory(pid) for pid in children(proc.pid)}
+        master_memory = memory(proc.pid)
+    finally:
+        stop_server(proc)
+        metrics_dir.cleanup()
+    return {
+        "preload": preload,
+        "time_to_first_move_s": round(done - start, 3),
+        "first_move_latency_s": round(done - sent, 3),
+        "master": master_memory,
+        "workers": worker_memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup warm-up tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    snap = sub.add_parser("snapshot", help="precompute a TT snapshot from opening positions")
+    snap.add_argument("pgn", nargs="*", default=[os.path.join(ROOT, "brilliant_move_game.pgn")])
+    snap.add_argument("--out", default=TT_SNAPSHOT)
+    snap.add_argument("--plies", type=int, default=30, help="positions from the first N plies of each game")
+    snap.add_argument("--depth", type=int, default=4)
+    snap.add_argument("--max-entries", type=int, default=engine.TT_MAX_ENTRIES // 2,
+                      help="keep room in the TT for the workers' own searches")
+
+    meas = sub.add_parser("measure", help="time-to-first-move and memory, with and without preload")
+    meas.add_argument("--workers", type=int, default=2)
+    meas.add_argument("--depth", type=int, default=3)
+    meas.add_argument("--snapshot", default=TT_SNAPSHOT)
+
+    args = parser.parse_args()
+    if args.command == "snapshot":
+        build_snapshot(args.pgn, args.out, args.plies, args.depth, args.max_entries)
+    else:
+        report = [measure(preload, args.workers, args.depth, args.snapshot) for preload in (False, True)]
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()